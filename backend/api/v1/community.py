@@ -1,13 +1,56 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, Response, request, jsonify
 from datetime import datetime
 from bson import ObjectId
 from auth.models import User
 from models.community_posts import CommunityPost, PostComment
 from models.chat import ChatConversation, ChatMessage
+from models.pagination import InvalidCursorError, encode_cursor
+from services.feed_cache_service import FeedCacheService
+from services.chat_pubsub_service import (
+    acquire_stream_slot, conversation_channel, get_broker, release_stream_slot, wait_for_message
+)
+from config import config
+import json
 import logging
+import time
 
 community_bp = Blueprint('community', __name__)
 
+def _apply_user_status(posts, current_user_id=None):
+    """Add the current user's like/star flags to already serialized posts"""
+    liked_ids, starred_ids = set(), set()
+    if current_user_id:
+        liked_ids, starred_ids = CommunityPost.get_user_interaction_status(
+            [post['_id'] for post in posts], current_user_id
+        )
+
+    for post in posts:
+        post['isLiked'] = post['_id'] in liked_ids
+        post['isStarred'] = post['_id'] in starred_ids
+
+    return posts
+
+def _serialize_posts(posts, current_user_id=None):
+    """Convert posts for JSON and add the current user's like/star flags"""
+    for post in posts:
+        post['_id'] = str(post['_id'])
+        post['user_id'] = str(post['user_id'])
+        post['created_at'] = post['created_at'].isoformat()
+
+    return _apply_user_status(posts, current_user_id)
+
+def _serialize_comment(comment):
+    """Convert a comment (and any nested replies) for JSON"""
+    comment['_id'] = str(comment['_id'])
+    comment['post_id'] = str(comment['post_id'])
+    comment['user_id'] = str(comment['user_id'])
+    comment['thread_user_id'] = str(comment['thread_user_id'])
+    comment['parent_comment_id'] = str(comment['parent_comment_id']) if comment.get('parent_comment_id') else None
+    comment['created_at'] = comment['created_at'].isoformat()
+    for reply in comment.get('replies', []):
+        _serialize_comment(reply)
+    return comment
+
 @community_bp.route('/posts', methods=['POST'])
 def create_post():
     """Create a new community post"""
@@ -70,11 +113,16 @@ def get_posts():
     try:
         limit = request.args.get('limit', 20, type=int)
         skip = request.args.get('skip', 0, type=int)
+        cursor = request.args.get('cursor', '').strip()
+        sort = request.args.get('sort', 'recent').strip()
         mood_filter = request.args.get('mood', '').strip()
         activity_type_filter = request.args.get('activity_type', '').strip()
         
-        if limit > 50:
-            limit = 50
+        # limit=0 would mean no limit to Mongo
+        limit = max(1, min(limit, 50))
+
+        if sort not in ('recent', 'trending'):
+            return jsonify({"error": "sort must be 'recent' or 'trending'"}), 400
         
         # Get current user if authenticated
         current_user_id = None
@@ -83,37 +131,183 @@ def get_posts():
             token = auth_header.split(' ')[1]
             current_user_id = User.verify_jwt_token(token)
         
-        posts = CommunityPost.get_posts(
-            limit=limit,
-            skip=skip,
-            mood_filter=mood_filter if mood_filter else None,
-            activity_type_filter=activity_type_filter if activity_type_filter else None
-        )
+        if sort == 'trending':
+            try:
+                posts, next_cursor = CommunityPost.get_trending_posts(
+                    limit=limit,
+                    mood_filter=mood_filter if mood_filter else None,
+                    activity_type_filter=activity_type_filter if activity_type_filter else None,
+                    cursor=cursor if cursor else None
+                )
+            except InvalidCursorError:
+                return jsonify({"error": "Invalid cursor"}), 400
+            _serialize_posts(posts, current_user_id)
+
+            return jsonify({
+                "posts": posts,
+                "count": len(posts),
+                "has_more": next_cursor is not None,
+                "next_cursor": next_cursor
+            }), 200
+
+        # First pages are served from the per-filter cache, deeper pages from the database
+        if not cursor and not skip and limit <= config.FEED_CACHE_SIZE:
+            posts, keys = FeedCacheService.get_first_page(
+                limit,
+                mood_filter=mood_filter if mood_filter else None,
+                activity_type_filter=activity_type_filter if activity_type_filter else None
+            )
+        else:
+            try:
+                posts = CommunityPost.get_posts(
+                    limit=limit,
+                    skip=skip,
+                    mood_filter=mood_filter if mood_filter else None,
+                    activity_type_filter=activity_type_filter if activity_type_filter else None,
+                    cursor=cursor if cursor else None
+                )
+            except InvalidCursorError:
+                return jsonify({"error": "Invalid cursor"}), 400
+            keys = [(post['created_at'], post['_id']) for post in posts]
+            _serialize_posts(posts)
+
+        next_cursor = encode_cursor(*keys[-1]) if keys and len(keys) == limit else None
+        # Starting point for /posts/updates when refreshing from the top of the feed
+        head_cursor = encode_cursor(*keys[0]) if keys else None
         
         # Add user interaction status to each post
-        for post in posts:
-            post['_id'] = str(post['_id'])
-            post['user_id'] = str(post['user_id'])
-            post['created_at'] = post['created_at'].isoformat()
-            
-            # Add like/star status for current user
-            if current_user_id:
-                post['isLiked'] = CommunityPost.is_post_liked_by_user(str(post['_id']), current_user_id)
-                post['isStarred'] = CommunityPost.is_post_starred_by_user(str(post['_id']), current_user_id)
-            else:
-                post['isLiked'] = False
-                post['isStarred'] = False
+        _apply_user_status(posts, current_user_id)
         
         return jsonify({
             "posts": posts,
             "count": len(posts),
-            "has_more": len(posts) == limit
+            "has_more": len(posts) == limit,
+            "next_cursor": next_cursor,
+            "head_cursor": head_cursor
         }), 200
         
     except Exception as e:
         logging.error(f"Error getting posts: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@community_bp.route('/posts/updates', methods=['GET'])
+def get_post_updates():
+    """Get posts newer than a feed cursor plus counter changes for posts on screen"""
+    try:
+        since = request.args.get('since', '').strip()
+        limit = request.args.get('limit', 20, type=int)
+        mood_filter = request.args.get('mood', '').strip()
+        activity_type_filter = request.args.get('activity_type', '').strip()
+        counters_since_raw = request.args.get('counters_since', '').strip()
+        ids_raw = request.args.get('ids', '').strip()
+
+        if not since:
+            return jsonify({"error": "since is required"}), 400
+
+        # limit=0 would mean no limit to Mongo
+        limit = max(1, min(limit, 50))
+
+        post_ids = [post_id for post_id in ids_raw.split(',') if post_id] if ids_raw else []
+        if len(post_ids) > 100:
+            return jsonify({"error": "At most 100 ids are allowed"}), 400
+        if not all(ObjectId.is_valid(post_id) for post_id in post_ids):
+            return jsonify({"error": "Invalid post id"}), 400
+
+        counters_since = None
+        if counters_since_raw:
+            try:
+                counters_since = datetime.fromisoformat(counters_since_raw)
+            except ValueError:
+                return jsonify({"error": "Invalid counters_since format"}), 400
+
+        current_user_id = None
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            current_user_id = User.verify_jwt_token(token)
+
+        # Taken before reading so changes made during this request are seen next time
+        server_time = datetime.utcnow()
+
+        try:
+            posts = CommunityPost.get_posts_since(
+                since,
+                limit=limit,
+                mood_filter=mood_filter if mood_filter else None,
+                activity_type_filter=activity_type_filter if activity_type_filter else None
+            )
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        next_since = since
+        if posts:
+            next_since = encode_cursor(posts[-1]['created_at'], posts[-1]['_id'])
+        has_more = len(posts) == limit
+
+        counters = CommunityPost.get_counters(post_ids, counters_since)
+
+        # Newest first, matching the feed
+        posts.reverse()
+        _serialize_posts(posts, current_user_id)
+
+        return jsonify({
+            "posts": posts,
+            "count": len(posts),
+            "has_more": has_more,
+            "since": next_since,
+            "counters": counters,
+            "server_time": server_time.isoformat()
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting post updates: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@community_bp.route('/posts/search', methods=['GET'])
+def search_posts():
+    """Search public posts by activity title, description and note"""
+    try:
+        text = request.args.get('q', '').strip()
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        cursor = request.args.get('cursor', '').strip()
+        mood_filter = request.args.get('mood', '').strip()
+        activity_type_filter = request.args.get('activity_type', '').strip()
+
+        if not text:
+            return jsonify({"error": "q is required"}), 400
+        if len(text) > 200:
+            return jsonify({"error": "q must be at most 200 characters"}), 400
+
+        current_user_id = None
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            current_user_id = User.verify_jwt_token(token)
+
+        try:
+            posts, next_cursor = CommunityPost.search_posts(
+                text,
+                limit=limit,
+                mood_filter=mood_filter if mood_filter else None,
+                activity_type_filter=activity_type_filter if activity_type_filter else None,
+                cursor=cursor if cursor else None
+            )
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        _serialize_posts(posts, current_user_id)
+
+        return jsonify({
+            "posts": posts,
+            "count": len(posts),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error searching posts: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @community_bp.route('/posts/<post_id>', methods=['GET'])
 def get_post(post_id):
     """Get a specific post by ID"""
@@ -146,11 +340,9 @@ def like_post(post_id):
         if not user_id:
             return jsonify({"error": "Invalid or expired token"}), 401
         
-        post = CommunityPost.get_post_by_id(post_id)
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
-        
         success = CommunityPost.like_post(post_id, user_id)
+        if success is None:
+            return jsonify({"error": "Post not found"}), 404
         
         if success:
             return jsonify({
@@ -206,11 +398,9 @@ def star_post(post_id):
         if not user_id:
             return jsonify({"error": "Invalid or expired token"}), 401
         
-        post = CommunityPost.get_post_by_id(post_id)
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
-        
         success = CommunityPost.star_post(post_id, user_id)
+        if success is None:
+            return jsonify({"error": "Post not found"}), 404
         
         if success:
             return jsonify({
@@ -369,12 +559,7 @@ def get_comments(post_id):
         )
         
         for comment in comments:
-            comment['_id'] = str(comment['_id'])
-            comment['post_id'] = str(comment['post_id'])
-            comment['user_id'] = str(comment['user_id'])
-            comment['thread_user_id'] = str(comment['thread_user_id'])
-            comment['parent_comment_id'] = str(comment['parent_comment_id']) if comment.get('parent_comment_id') else None
-            comment['created_at'] = comment['created_at'].isoformat()
+            _serialize_comment(comment)
         
         return jsonify({
             "comments": comments,
@@ -385,6 +570,111 @@ def get_comments(post_id):
         logging.error(f"Error getting comments: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@community_bp.route('/posts/<post_id>/threads', methods=['GET'])
+def get_comment_threads(post_id):
+    """Get per-thread summaries for a post (owners see every thread, others only their own)"""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Authorization header required"}), 401
+
+        token = auth_header.split(' ')[1]
+        user_id = User.verify_jwt_token(token)
+        if not user_id:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        cursor = request.args.get('cursor', '').strip()
+
+        post = CommunityPost.get_post_by_id(post_id)
+        if not post:
+            return jsonify({"error": "Post not found"}), 404
+
+        is_owner = str(user_id) == str(post.get('user_id'))
+
+        try:
+            threads, next_cursor = PostComment.get_thread_summaries(
+                post_id,
+                limit=limit,
+                cursor=cursor if cursor else None,
+                thread_user_id=None if is_owner else user_id
+            )
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        threads = [
+            {
+                "thread_user_id": str(thread['_id']),
+                "thread_username": thread.get('thread_username'),
+                "count": thread['count'],
+                "last_comment_at": thread['last_comment_at'].isoformat(),
+                "last_comment": _serialize_comment(thread['last_comment'])
+            }
+            for thread in threads
+        ]
+
+        return jsonify({
+            "threads": threads,
+            "count": len(threads),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting comment threads: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@community_bp.route('/posts/<post_id>/threads/<thread_user_id>', methods=['GET'])
+def get_comment_thread(post_id, thread_user_id):
+    """Get one page of a comment thread as a reply tree"""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Authorization header required"}), 401
+
+        token = auth_header.split(' ')[1]
+        user_id = User.verify_jwt_token(token)
+        if not user_id:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        if not ObjectId.is_valid(thread_user_id):
+            return jsonify({"error": "Invalid thread_user_id"}), 400
+
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+        cursor = request.args.get('cursor', '').strip()
+
+        post = CommunityPost.get_post_by_id(post_id)
+        if not post:
+            return jsonify({"error": "Post not found"}), 404
+
+        is_owner = str(user_id) == str(post.get('user_id'))
+        if not is_owner and str(user_id) != thread_user_id:
+            return jsonify({"error": "Thread not found"}), 404
+
+        try:
+            comments, next_cursor = PostComment.get_thread_comments(
+                post_id,
+                thread_user_id,
+                limit=limit,
+                cursor=cursor if cursor else None
+            )
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        page_count = len(comments)
+        comments = [_serialize_comment(comment) for comment in PostComment.build_reply_tree(comments)]
+
+        return jsonify({
+            "comments": comments,
+            "count": page_count,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error getting comment thread: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @community_bp.route('/my-posts', methods=['GET'])
 def get_my_posts():
     """Get current user's posts"""
@@ -401,12 +691,7 @@ def get_my_posts():
         
         # Get user's posts
         posts = CommunityPost.get_user_posts(user_id)
-        
-        # Convert ObjectId to string
-        for post in posts:
-            post['_id'] = str(post['_id'])
-            post['user_id'] = str(post['user_id'])
-            post['created_at'] = post['created_at'].isoformat()
+        _serialize_posts(posts, user_id)
         
         return jsonify({
             "posts": posts,
@@ -430,16 +715,23 @@ def get_my_liked_posts():
         if not user_id:
             return jsonify({"error": "Invalid or expired token"}), 401
         
-        posts = CommunityPost.get_user_liked_posts(user_id)
-        
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        cursor = request.args.get('cursor', '').strip()
+
+        try:
+            posts, next_cursor = CommunityPost.get_user_liked_posts(user_id, limit=limit, cursor=cursor if cursor else None)
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
         for post in posts:
-            post['_id'] = str(post['_id'])
-            post['user_id'] = str(post['user_id'])
-            post['created_at'] = post['created_at'].isoformat()
+            post['liked_at'] = post['liked_at'].isoformat()
+        _serialize_posts(posts, user_id)
         
         return jsonify({
             "posts": posts,
-            "count": len(posts)
+            "count": len(posts),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
@@ -459,16 +751,41 @@ def list_conversations():
         if not user_id:
             return jsonify({"error": "Invalid or expired token"}), 401
 
-        conversations = ChatConversation.list_for_user(user_id)
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        cursor = request.args.get('cursor', '').strip()
+
+        try:
+            conversations, next_cursor = ChatConversation.list_for_user(
+                user_id,
+                limit=limit,
+                cursor=cursor if cursor else None
+            )
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
         for convo in conversations:
             convo['_id'] = str(convo['_id'])
             convo['participant_usernames'] = convo.get('participant_usernames', {})
             if convo.get('last_message_at'):
                 convo['last_message_at'] = convo['last_message_at'].isoformat()
+            if convo.get('last_message_id'):
+                convo['last_message_id'] = str(convo['last_message_id'])
             if convo.get('last_message_sender_id'):
                 convo['last_message_sender_id'] = str(convo['last_message_sender_id'])
 
-        return jsonify({"conversations": conversations}), 200
+            # Only the caller's own read position and unread count are returned
+            read_state = (convo.pop('read_state', None) or {}).get(str(user_id), {})
+            convo['unread_count'] = (convo.pop('unread_counts', None) or {}).get(str(user_id), 0)
+            convo['last_read_at'] = read_state['last_read_at'].isoformat() if read_state.get('last_read_at') else None
+            convo['last_read_id'] = str(read_state['last_read_id']) if read_state.get('last_read_id') else None
+            convo['last_message_preview'] = convo.get('last_message_preview')
+            convo['last_message_sender_username'] = convo.get('last_message_sender_username')
+
+        return jsonify({
+            "conversations": conversations,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
+        }), 200
     except Exception as e:
         logging.error(f"Error listing conversations: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
@@ -525,21 +842,205 @@ def get_conversation_messages(conversation_id):
             except ValueError:
                 return jsonify({"error": "Invalid since format"}), 400
 
-        messages = ChatMessage.get_messages(conversation_id, since)
-        for message in messages:
-            sender_user = g.db.users.find_one({"_id": ObjectId(message['sender_id'])})
-            message['_id'] = str(message['_id'])
-            message['conversation_id'] = str(message['conversation_id'])
-            message['sender_id'] = str(message['sender_id'])
-            message['sender_username'] = sender_user.get('username', 'User') if sender_user else 'User'
-            message['client_id'] = message.get('client_id')
-            message['created_at'] = message['created_at'].isoformat()
-
-        return jsonify({"messages": messages}), 200
+        wait = request.args.get('wait', 0, type=float)
+        before = request.args.get('before', '').strip()
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+
+        # Without since: newest page first, then scroll up with the returned before cursor
+        before_cursor = None
+        if not since:
+            try:
+                messages, before_cursor = ChatMessage.get_history(
+                    conversation_id,
+                    before=before if before else None,
+                    limit=limit
+                )
+            except InvalidCursorError:
+                return jsonify({"error": "Invalid cursor"}), 400
+            has_more = before_cursor is not None
+        else:
+            if wait > 0:
+                # Long poll: subscribe before reading so a message sent in between still wakes us
+                subscription = get_broker().subscribe(conversation_channel(conversation_id))
+                try:
+                    messages = ChatMessage.get_messages(conversation_id, since, limit)
+                    if not messages and wait_for_message(subscription, wait):
+                        messages = ChatMessage.get_messages(conversation_id, since, limit)
+                finally:
+                    subscription.close()
+            else:
+                messages = ChatMessage.get_messages(conversation_id, since, limit)
+            # Catch-up is oldest first; when full, call again from the last message
+            has_more = len(messages) == limit
+
+        usernames = ChatConversation.resolve_usernames(convo, {message['sender_id'] for message in messages})
+        serialized = [
+            ChatMessage.serialize(message, usernames.get(str(message['sender_id']), 'User'))
+            for message in messages
+        ]
+
+        return jsonify({
+            "messages": serialized,
+            "has_more": has_more,
+            "before_cursor": before_cursor
+        }), 200
     except Exception as e:
         logging.error(f"Error getting messages: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@community_bp.route('/conversations/<conversation_id>/read', methods=['POST'])
+def mark_conversation_read(conversation_id):
+    """Mark a conversation read up to a message (the latest one by default)"""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Authorization header required"}), 401
+
+        token = auth_header.split(' ')[1]
+        user_id = User.verify_jwt_token(token)
+        if not user_id:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        convo = ChatConversation.get_by_id(conversation_id)
+        if not convo or str(user_id) not in convo.get('participants', []):
+            return jsonify({"error": "Conversation not found"}), 404
+
+        data = request.get_json(silent=True) or {}
+        message_id = data.get('message_id')
+        if message_id:
+            if not ObjectId.is_valid(message_id):
+                return jsonify({"error": "Invalid message_id"}), 400
+            message = ChatMessage.get_by_id(conversation_id, message_id)
+            if not message:
+                return jsonify({"error": "Message not found"}), 404
+        else:
+            messages, _ = ChatMessage.get_history(conversation_id, limit=1)
+            if not messages:
+                return jsonify({"unread_count": 0}), 200
+            message = messages[0]
+
+        last_read_id = message['_id']
+        unread_count = ChatConversation.mark_read(conversation_id, user_id, message)
+        if unread_count is None:
+            # Already read past this message, report the existing cursor
+            unread_count = convo.get('unread_counts', {}).get(str(user_id), 0)
+            last_read_id = convo.get('read_state', {}).get(str(user_id), {}).get('last_read_id', last_read_id)
+
+        return jsonify({
+            "unread_count": unread_count,
+            "last_read_id": str(last_read_id)
+        }), 200
+    except Exception as e:
+        logging.error(f"Error marking conversation read: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@community_bp.route('/conversations/<conversation_id>/stream', methods=['GET'])
+def stream_conversation_messages(conversation_id):
+    """Push new messages in a conversation as server-sent events
+
+    EventSource cannot set headers, so the token may also be passed as
+    ?token=. On reconnect the browser sends Last-Event-ID (the created_at of
+    the last message received) and anything newer is replayed first. A replay
+    longer than CHAT_STREAM_MAX_REPLAY messages ends the stream after that
+    many, and the client picks up the rest on reconnect. Streams end after
+    CHAT_STREAM_MAX_SECONDS and the client reconnects.
+    """
+    try:
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+        else:
+            token = request.args.get('token', '')
+        if not token:
+            return jsonify({"error": "Authorization header required"}), 401
+
+        user_id = User.verify_jwt_token(token)
+        if not user_id:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        convo = ChatConversation.get_by_id(conversation_id)
+        if not convo or str(user_id) not in convo.get('participants', []):
+            return jsonify({"error": "Conversation not found"}), 404
+
+        since_raw = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since = None
+        if since_raw:
+            try:
+                since = datetime.fromisoformat(since_raw)
+            except ValueError:
+                return jsonify({"error": "Invalid since format"}), 400
+
+        # Each open stream holds a server thread; past the limit, clients fall back to long polling
+        if not acquire_stream_slot():
+            return jsonify({"error": "Too many open streams, use long polling"}), 503
+
+        # Subscribe before reading the backlog so nothing sent in between is missed
+        try:
+            subscription = get_broker().subscribe(conversation_channel(conversation_id))
+        except Exception:
+            release_stream_slot()
+            raise
+        try:
+            backlog = []
+            replay_truncated = False
+            if since:
+                messages = []
+                page_size = 50
+                while True:
+                    page = ChatMessage.get_messages(conversation_id, since, limit=page_size)
+                    messages.extend(page)
+                    if len(page) < page_size:
+                        break
+                    if len(messages) >= config.CHAT_STREAM_MAX_REPLAY:
+                        replay_truncated = True
+                        break
+                    since = page[-1]['created_at']
+                usernames = ChatConversation.resolve_usernames(convo, {message['sender_id'] for message in messages})
+                backlog = [
+                    ChatMessage.serialize(message, usernames.get(str(message['sender_id']), 'User'))
+                    for message in messages
+                ]
+        except Exception:
+            subscription.close()
+            release_stream_slot()
+            raise
+
+        def generate():
+            sent_ids = set()
+            deadline = time.monotonic() + config.CHAT_STREAM_MAX_SECONDS
+            try:
+                yield "retry: 3000\n\n"
+                for message in backlog:
+                    sent_ids.add(message['_id'])
+                    yield f"id: {message['created_at']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+                if replay_truncated:
+                    # Reconnecting resumes from the last replayed message
+                    return
+
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    message = subscription.get(min(remaining, config.CHAT_STREAM_HEARTBEAT_SECONDS))
+                    if message is None:
+                        yield ": keepalive\n\n"
+                    elif message['_id'] not in sent_ids:
+                        sent_ids.add(message['_id'])
+                        yield f"id: {message['created_at']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+            finally:
+                subscription.close()
+
+        response = Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # Runs when the server closes the response, even if the generator never started
+        response.call_on_close(release_stream_slot)
+        return response
+    except Exception as e:
+        logging.error(f"Error opening message stream: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @community_bp.route('/conversations/<conversation_id>/messages', methods=['POST'])
 def send_conversation_message(conversation_id):
     """Send a message in a conversation"""
@@ -565,8 +1066,10 @@ def send_conversation_message(conversation_id):
         client_id = data.get('client_id')
         if not text:
             return jsonify({"error": "text is required"}), 400
+        if client_id is not None and (not isinstance(client_id, str) or len(client_id) > 64):
+            return jsonify({"error": "client_id must be a string of at most 64 characters"}), 400
 
-        message_id = ChatMessage.create(conversation_id, user_id, text, client_id)
+        message_id = ChatMessage.create(conversation_id, user_id, text, client_id, convo=convo)
         return jsonify({"message_id": message_id, "client_id": client_id}), 201
     except Exception as e:
         logging.error(f"Error sending message: {str(e)}")
@@ -587,17 +1090,23 @@ def get_my_starred_posts():
             return jsonify({"error": "Invalid or expired token"}), 401
         
         # Get user's starred posts
-        posts = CommunityPost.get_user_starred_posts(user_id)
-        
-        # Convert ObjectId to string
+        limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+        cursor = request.args.get('cursor', '').strip()
+
+        try:
+            posts, next_cursor = CommunityPost.get_user_starred_posts(user_id, limit=limit, cursor=cursor if cursor else None)
+        except InvalidCursorError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
         for post in posts:
-            post['_id'] = str(post['_id'])
-            post['user_id'] = str(post['user_id'])
-            post['created_at'] = post['created_at'].isoformat()
+            post['starred_at'] = post['starred_at'].isoformat()
+        _serialize_posts(posts, user_id)
         
         return jsonify({
             "posts": posts,
-            "count": len(posts)
+            "count": len(posts),
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
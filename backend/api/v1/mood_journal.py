@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify, g
 from datetime import datetime, date, timezone
 from auth.models import User
-from models.mood_journal import MoodEntry, Recommendation, UserFeedback
+from models.mood_journal import MoodEntry, Recommendation, UserFeedback, AIFeedback
 from services.mood_ai_service import MoodAIService
+from services.job_service import JobService, JobQueueFullError
 import asyncio
 import logging
 
@@ -238,6 +239,19 @@ def chat_support():
         if not entry_text:
             return jsonify({"error": "entry_text is required"}), 400
 
+        # Job mode: queue the analysis and let the client poll for the result
+        if data.get('async') is True or request.args.get('mode') == 'async':
+            try:
+                job_id = JobService.submit_counseling(user_id, entry_text, mood)
+            except JobQueueFullError:
+                return jsonify({"error": "Too many pending requests, please retry shortly"}), 503
+
+            return jsonify({
+                "job_id": job_id,
+                "status": "pending",
+                "status_url": f"{request.script_root}{request.path}/jobs/{job_id}"
+            }), 202
+
         analysis = asyncio.run(
             MoodAIService.analyze_sentiment_and_counseling(entry_text, mood)
         )
@@ -248,6 +262,45 @@ def chat_support():
         logging.error(f"Error running chat support: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@mood_journal_bp.route('/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Get the status and result of an async chat support job"""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Authorization header required"}), 401
+
+        token = auth_header.split(' ')[1]
+        user_id = User.verify_jwt_token(token)
+        if not user_id:
+            return jsonify({"error": "Invalid or expired token"}), 401
+
+        # Optional long-poll: hold the request until the job finishes or wait expires
+        wait = request.args.get('wait', 0, type=float)
+        if wait > 0:
+            job = JobService.wait_for_job(job_id, user_id, wait)
+        else:
+            job = JobService.get_job(job_id, user_id)
+
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        response = {
+            "job_id": job_id,
+            "status": job['status'],
+            "created_at": job['created_at'].isoformat()
+        }
+        if job['status'] == 'done':
+            response['result'] = job['result']
+        elif job['status'] == 'failed':
+            response['error'] = job.get('error')
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        logging.error(f"Error getting chat job: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @mood_journal_bp.route('/feedback', methods=['POST'])
 def submit_feedback():
     """Submit feedback for a recommendation"""
@@ -613,21 +666,15 @@ def submit_ai_recommendation_feedback():
         if not mood:
             return jsonify({"error": "mood is required"}), 400
         
-        # For AI recommendations, we'll store the feedback in a simple way
-        # You could extend this to store in a separate collection for AI feedback
-        feedback_data = {
-            'user_id': user_id,
-            'recommendation_title': recommendation_title,
-            'recommendation_type': recommendation_type,
-            'recommendation_description': recommendation_description,
-            'liked': liked,
-            'mood': mood,
-            'created_at': datetime.now(),
-            'is_ai_recommendation': True
-        }
-        
-        # For now, just log the feedback (you could store it in a database later)
-        logging.info(f"AI Recommendation Feedback: {feedback_data}")
+        # Buffered and written to the ai_feedback collection in batches
+        AIFeedback.create(
+            user_id=user_id,
+            recommendation_title=recommendation_title,
+            recommendation_type=recommendation_type,
+            recommendation_description=recommendation_description,
+            liked=liked,
+            mood=mood
+        )
         
         return jsonify({
             "message": "AI recommendation feedback submitted successfully",
@@ -4,7 +4,6 @@ from datetime import datetime
 from bson import ObjectId
 from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from pymongo import MongoClient
 from config import config
 import logging
 import pdb  # Python debugger
@@ -14,6 +13,8 @@ try:
     from auth.routes import auth_bp
     from api.v1.mood_journal import mood_journal_bp
     from api.v1.community import community_bp
+    from models.indexes import ensure_indexes
+    from models.database import get_background_db
 except ImportError:
     # Fallback for when running from parent directory
     import sys
@@ -21,6 +22,8 @@ except ImportError:
     from auth.routes import auth_bp
     from api.v1.mood_journal import mood_journal_bp
     from api.v1.community import community_bp
+    from models.indexes import ensure_indexes
+    from models.database import get_background_db
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, o):
@@ -44,21 +47,22 @@ def create_app():
     @app.before_request
     def before_request():
         try:
-            if 'db_client' not in g:
-                mongo_uri = config.MONGO_URI
-                if not mongo_uri:
-                    raise ValueError("MONGO_URI environment variable not set.")
-                g.db_client = MongoClient(mongo_uri)
-                g.db = g.db_client.get_default_database()
+            if not config.MONGO_URI:
+                raise ValueError("MONGO_URI environment variable not set.")
+            # One pooled client per worker process, shared by every request thread
+            g.db = get_background_db()
         except Exception as e:
             app.logger.critical(f"Could not connect to MongoDB: {e}")
             g.db = None 
 
-    @app.teardown_request
-    def teardown_request(exception):
-        db_client = g.pop('db_client', None)
-        if db_client is not None:
-            db_client.close()
+        # Build indexes once per worker on the first request. Failures are logged
+        # and not retried per request; `python maintenance.py ensure-indexes` retries them
+        if g.db is not None and not app.config.get('INDEXES_ENSURED'):
+            app.config['INDEXES_ENSURED'] = True
+            try:
+                ensure_indexes(g.db)
+            except Exception as e:
+                app.logger.error(f"Could not ensure MongoDB indexes: {e}")
 
     # Configure logging
     logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
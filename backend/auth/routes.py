@@ -4,6 +4,7 @@ from functools import wraps
 import jwt
 from auth.models import User
 from auth.utils import hash_password, verify_password
+from services.username_propagation_service import UsernamePropagationService
 
 auth_bp = Blueprint("auth_bp", __name__)
 
@@ -157,6 +158,13 @@ def update_profile():
         if not success:
             return jsonify({'error': 'Failed to update profile'}), 500
 
+        # Posts, comments and conversations keep a copy of the username; refresh them in the background
+        if username != g.current_user.get('username'):
+            try:
+                UsernamePropagationService.request(g.db, str(g.current_user['_id']), username)
+            except Exception as e:
+                current_app.logger.error(f"Error queueing username propagation: {str(e)}")
+
         current_app.logger.info(f"Profile updated successfully for user {g.current_user['_id']}")
         return jsonify({
             'message': 'Profile updated successfully',
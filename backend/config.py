@@ -22,7 +22,63 @@ class Config:
     API_PROVIDER = os.getenv('AI_PROVIDER', 'openai')
     AI_MODEL_NAME = os.getenv('AI_MODEL_NAME', 'gpt-4o-mini')
     API_KEY = os.getenv('API_KEY', '')
-    
+
+    # Event Buffer Configuration (ai_feedback, recommendation_impressions)
+    EVENT_BUFFER_BATCH_SIZE = int(os.getenv('EVENT_BUFFER_BATCH_SIZE', 100))
+    EVENT_BUFFER_FLUSH_SECONDS = float(os.getenv('EVENT_BUFFER_FLUSH_SECONDS', 5))
+    EVENT_BUFFER_MAX_PENDING = int(os.getenv('EVENT_BUFFER_MAX_PENDING', 10000))
+
+    # Async AI Job Configuration
+    AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', 4))
+    AI_JOB_MAX_PENDING = int(os.getenv('AI_JOB_MAX_PENDING', 100))
+    AI_JOB_RESULT_TTL = int(os.getenv('AI_JOB_RESULT_TTL', 3600))
+    AI_JOB_MAX_WAIT = int(os.getenv('AI_JOB_MAX_WAIT', 25))
+    AI_JOB_MAX_WAITERS = int(os.getenv('AI_JOB_MAX_WAITERS', 10))
+    AI_JOB_HEARTBEAT_SECONDS = int(os.getenv('AI_JOB_HEARTBEAT_SECONDS', 30))
+    AI_JOB_STALE_SECONDS = int(os.getenv('AI_JOB_STALE_SECONDS', 120))
+    AI_JOB_MAX_POLL_SECONDS = float(os.getenv('AI_JOB_MAX_POLL_SECONDS', 5))
+
+    # Community Feed Cache Configuration
+    FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 50))
+    FEED_CACHE_TTL = float(os.getenv('FEED_CACHE_TTL', 10))
+
+    # Post Counter Buffer Configuration (likes, stars, comments_count)
+    COUNTER_BUFFER_ENABLED = os.getenv('COUNTER_BUFFER_ENABLED', 'False').lower() == 'true'
+    COUNTER_FLUSH_SECONDS = float(os.getenv('COUNTER_FLUSH_SECONDS', 2))
+    COUNTER_BUFFER_MAX_DOCUMENTS = int(os.getenv('COUNTER_BUFFER_MAX_DOCUMENTS', 5000))
+
+    # Chat Push Configuration (in-process pub/sub, or Redis when REDIS_URL is set)
+    REDIS_URL = os.getenv('REDIS_URL', '')
+    CHAT_STREAM_MAX_SECONDS = int(os.getenv('CHAT_STREAM_MAX_SECONDS', 300))
+    CHAT_STREAM_HEARTBEAT_SECONDS = int(os.getenv('CHAT_STREAM_HEARTBEAT_SECONDS', 15))
+    CHAT_STREAM_MAX_STREAMS = int(os.getenv('CHAT_STREAM_MAX_STREAMS', 40))
+    CHAT_STREAM_MAX_REPLAY = int(os.getenv('CHAT_STREAM_MAX_REPLAY', 500))
+    CHAT_LONG_POLL_MAX_WAIT = int(os.getenv('CHAT_LONG_POLL_MAX_WAIT', 25))
+    CHAT_LONG_POLL_MAX_WAITERS = int(os.getenv('CHAT_LONG_POLL_MAX_WAITERS', 30))
+
+    # Chat Message Storage (one document per message, or buckets of messages per conversation)
+    CHAT_BUCKETS_ENABLED = os.getenv('CHAT_BUCKETS_ENABLED', 'False').lower() == 'true'
+    CHAT_BUCKET_SIZE = int(os.getenv('CHAT_BUCKET_SIZE', 100))
+    CHAT_PREVIEW_LENGTH = int(os.getenv('CHAT_PREVIEW_LENGTH', 100))
+
+    # Retention Configuration (days, 0 keeps data forever)
+    RETENTION_IMPRESSION_DAYS = int(os.getenv('RETENTION_IMPRESSION_DAYS', 90))
+    RETENTION_AI_FEEDBACK_DAYS = int(os.getenv('RETENTION_AI_FEEDBACK_DAYS', 365))
+    RETENTION_LEGACY_RECOMMENDATION_DAYS = int(os.getenv('RETENTION_LEGACY_RECOMMENDATION_DAYS', 30))
+    CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', 180))
+
+    # Username Propagation (copies of usernames on posts, comments and conversations)
+    USERNAME_PROPAGATION_BATCH_SIZE = int(os.getenv('USERNAME_PROPAGATION_BATCH_SIZE', 500))
+    USERNAME_PROPAGATION_PAUSE_SECONDS = float(os.getenv('USERNAME_PROPAGATION_PAUSE_SECONDS', 0.1))
+
+    # Trending Feed Configuration
+    TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+    TRENDING_NEW_POST_SCORE = float(os.getenv('TRENDING_NEW_POST_SCORE', 1))
+    TRENDING_LIKE_WEIGHT = float(os.getenv('TRENDING_LIKE_WEIGHT', 1))
+    TRENDING_STAR_WEIGHT = float(os.getenv('TRENDING_STAR_WEIGHT', 2))
+    TRENDING_COMMENT_WEIGHT = float(os.getenv('TRENDING_COMMENT_WEIGHT', 3))
+    TRENDING_MIN_SCORE = float(os.getenv('TRENDING_MIN_SCORE', 0.01))
+
     # Server Configuration
     PORT = int(os.getenv('PORT', 8080))
     HOST = os.getenv('HOST', '0.0.0.0')
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Maintenance jobs for the Mood Journal backend
+Run from the backend directory, e.g. from cron:
+
+    python maintenance.py reconcile-counters
+"""
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+from config import config
+from models.database import get_background_db
+from models.chat_buckets import ChatBucket
+from models.community_posts import CommunityPost
+from models.indexes import ensure_indexes
+from services.username_propagation_service import UsernamePropagationService
+
+
+def ensure_missing_indexes(args):
+    """Create any missing indexes (the app logs index failures instead of retrying them)"""
+    ensure_indexes(get_background_db())
+    print("✅ Ensured indexes, see the log for any that could not be built")
+
+
+def reconcile_counters(args):
+    """Recompute post likes, stars and comments_count from the interaction collections"""
+    updated = CommunityPost.reconcile_counters(get_background_db(), batch_size=args.batch_size)
+    print(f"✅ Reconciled counters, {updated} posts corrected")
+
+
+def decay_trending(args):
+    """Decay post trending scores by the time since the last run and backfill missing ones"""
+    updated = CommunityPost.decay_trending_scores(get_background_db(), batch_size=args.batch_size)
+    if updated is None:
+        print("⚠️ Another decay-trending run is in progress, nothing done")
+        return
+    print(f"✅ Decayed trending scores, {updated} posts updated")
+
+
+def dedupe_interactions(args):
+    """Remove repeated likes/stars left by the old check-then-insert toggles"""
+    removed = CommunityPost.remove_duplicate_interactions(get_background_db())
+    print(f"✅ Removed {removed} duplicate likes/stars, run reconcile-counters next")
+
+
+def migrate_chat_buckets(args):
+    """Copy chat_messages into the bucket layout (re-run before enabling CHAT_BUCKETS_ENABLED)"""
+    copied = ChatBucket.migrate(get_background_db(), batch_size=args.batch_size)
+    print(f"✅ Copied {copied} chat messages into buckets")
+
+
+def archive_chat(args):
+    """Move chat messages older than CHAT_ARCHIVE_AFTER_DAYS into chat_message_archive"""
+    if config.CHAT_ARCHIVE_AFTER_DAYS <= 0:
+        print("CHAT_ARCHIVE_AFTER_DAYS is 0, nothing to archive")
+        return
+    older_than = datetime.utcnow() - timedelta(days=config.CHAT_ARCHIVE_AFTER_DAYS)
+    moved = ChatBucket.archive(get_background_db(), older_than, batch_size=args.batch_size)
+    print(f"✅ Archived {moved} chat documents older than {older_than:%Y-%m-%d}")
+
+
+def propagate_usernames(args):
+    """Apply queued username changes to posts, comments and conversations"""
+    updated = UsernamePropagationService.run_pending(get_background_db())
+    print(f"✅ Propagated username changes, {updated} documents updated")
+
+
+def main():
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
+
+    parser = argparse.ArgumentParser(description="Mood Journal maintenance jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    indexes = subparsers.add_parser("ensure-indexes", help=ensure_missing_indexes.__doc__)
+    indexes.set_defaults(func=ensure_missing_indexes)
+
+    reconcile = subparsers.add_parser("reconcile-counters", help=reconcile_counters.__doc__)
+    reconcile.add_argument("--batch-size", type=int, default=500)
+    reconcile.set_defaults(func=reconcile_counters)
+
+    decay = subparsers.add_parser("decay-trending", help=decay_trending.__doc__)
+    decay.add_argument("--batch-size", type=int, default=500)
+    decay.set_defaults(func=decay_trending)
+
+    dedupe = subparsers.add_parser("dedupe-interactions", help=dedupe_interactions.__doc__)
+    dedupe.set_defaults(func=dedupe_interactions)
+
+    buckets = subparsers.add_parser("migrate-chat-buckets", help=migrate_chat_buckets.__doc__)
+    buckets.add_argument("--batch-size", type=int, default=500)
+    buckets.set_defaults(func=migrate_chat_buckets)
+
+    archive = subparsers.add_parser("archive-chat", help=archive_chat.__doc__)
+    archive.add_argument("--batch-size", type=int, default=500)
+    archive.set_defaults(func=archive_chat)
+
+    usernames = subparsers.add_parser("propagate-usernames", help=propagate_usernames.__doc__)
+    usernames.set_defaults(func=propagate_usernames)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
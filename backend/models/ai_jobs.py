@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from flask import g
+from models.database import create_index
+
+class AIJob:
+    @staticmethod
+    def create(user_id: str, job_type: str, ttl_seconds: int):
+        """Create a pending job; the document expires ttl_seconds after creation"""
+        now = datetime.now(timezone.utc)
+        job_data = {
+            'user_id': ObjectId(user_id),
+            'type': job_type,
+            'status': 'pending',
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'completed_at': None,
+            'heartbeat_at': now,
+            'expires_at': now + timedelta(seconds=ttl_seconds)
+        }
+        result = g.db.ai_jobs.insert_one(job_data)
+        return str(result.inserted_id)
+
+    @staticmethod
+    def get_for_user(job_id: str, user_id: str):
+        """Get a job if it belongs to the user"""
+        try:
+            return g.db.ai_jobs.find_one({'_id': ObjectId(job_id), 'user_id': ObjectId(user_id)})
+        except:
+            return None
+
+    @staticmethod
+    def complete(db, job_id: str, result=None, error: str = None):
+        """Store the outcome of a job (called from worker threads, outside a request)"""
+        db.ai_jobs.update_one(
+            {'_id': ObjectId(job_id)},
+            {
+                '$set': {
+                    'status': 'failed' if error else 'done',
+                    'result': result,
+                    'error': error,
+                    'completed_at': datetime.now(timezone.utc)
+                }
+            }
+        )
+
+    @staticmethod
+    def heartbeat(db, job_ids: list):
+        """Mark pending jobs as still owned by a live worker"""
+        db.ai_jobs.update_many(
+            {'_id': {'$in': [ObjectId(job_id) for job_id in job_ids]}, 'status': 'pending'},
+            {'$set': {'heartbeat_at': datetime.now(timezone.utc)}}
+        )
+
+    @staticmethod
+    def is_stale(job: dict, stale_seconds: int) -> bool:
+        """Whether a pending job's worker has stopped sending heartbeats"""
+        heartbeat_at = job.get('heartbeat_at') or job['created_at']
+        if heartbeat_at.tzinfo is None:
+            heartbeat_at = heartbeat_at.replace(tzinfo=timezone.utc)
+        return job['status'] == 'pending' and heartbeat_at < datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+
+    @staticmethod
+    def fail_stale(job_id: str, stale_seconds: int):
+        """Fail a pending job whose worker died (restart, timeout kill) so clients stop polling it"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+        g.db.ai_jobs.update_one(
+            {
+                '_id': ObjectId(job_id),
+                'status': 'pending',
+                '$or': [
+                    {'heartbeat_at': {'$lt': cutoff}},
+                    {'heartbeat_at': {'$exists': False}, 'created_at': {'$lt': cutoff}}
+                ]
+            },
+            {
+                '$set': {
+                    'status': 'failed',
+                    'error': 'Analysis was interrupted, please retry',
+                    'completed_at': datetime.now(timezone.utc)
+                }
+            }
+        )
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for job lookups and result expiry"""
+        create_index(db.ai_jobs, [('expires_at', ASCENDING)], expireAfterSeconds=0)
+        create_index(db.ai_jobs, [('user_id', ASCENDING), ('created_at', DESCENDING)])
@@ -1,6 +1,13 @@
+import logging
 from datetime import datetime
 from bson import ObjectId
 from flask import g
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from config import config
+from models.chat_buckets import ChatBucket
+from models.database import create_index
+from models.pagination import decode_cursor, encode_cursor, keyset_filter
 
 
 class ChatConversation:
@@ -23,7 +30,9 @@ class ChatConversation:
             "created_at": datetime.utcnow(),
             "last_message_at": None,
             "last_message_sender_id": None,
-            "participant_usernames": ChatConversation._get_participant_usernames(participants)
+            "participant_usernames": ChatConversation._get_participant_usernames(participants),
+            "read_state": {},
+            "unread_counts": {participant_id: 0 for participant_id in participants}
         }
         result = g.db.chat_conversations.insert_one(data)
         return str(result.inserted_id)
@@ -38,46 +47,328 @@ class ChatConversation:
         return usernames
 
     @staticmethod
-    def list_for_user(user_id: str):
-        cursor = g.db.chat_conversations.find({
-            "participants": str(user_id)
-        }).sort("last_message_at", -1)
-        return list(cursor)
+    def resolve_usernames(convo: dict, user_ids):
+        """Map user ids to usernames from the conversation snapshot, with one $in query for any missing"""
+        usernames = dict(convo.get("participant_usernames") or {})
+        missing = {str(user_id) for user_id in user_ids} - set(usernames)
+        if missing:
+            for user in g.db.users.find(
+                {"_id": {"$in": [ObjectId(user_id) for user_id in missing]}},
+                {"username": 1}
+            ):
+                usernames[str(user["_id"])] = user.get("username", "User")
+        return usernames
+
+    @staticmethod
+    def list_for_user(user_id: str, limit: int = 20, cursor: str = None):
+        """Get the user's conversations by latest message, returns (conversations, next_cursor)
+
+        Conversations without messages come last.
+        """
+        query = {"participants": str(user_id)}
+        if cursor:
+            last_message_at, conversation_id = decode_cursor(cursor)
+            if last_message_at is None:
+                query.update({"last_message_at": None, "_id": {"$lt": conversation_id}})
+            else:
+                query["$or"] = keyset_filter("last_message_at", last_message_at, conversation_id)["$or"] + [
+                    {"last_message_at": None}
+                ]
+
+        conversations = list(g.db.chat_conversations.find(query).sort(
+            [("last_message_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit))
+
+        next_cursor = None
+        if conversations and len(conversations) == limit:
+            last = conversations[-1]
+            next_cursor = encode_cursor(last.get("last_message_at"), last["_id"])
+
+        return conversations, next_cursor
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for the conversation inbox"""
+        create_index(
+            db.chat_conversations,
+            [("participants", ASCENDING), ("last_message_at", DESCENDING), ("_id", DESCENDING)]
+        )
 
     @staticmethod
     def get_by_id(conversation_id: str):
         return g.db.chat_conversations.find_one({"_id": ObjectId(conversation_id)})
 
+    @staticmethod
+    def mark_read(conversation_id: str, user_id: str, message: dict, attempts: int = 5):
+        """Move the user's read cursor to `message` and recount what is still unread after it
+
+        Messages are counted up to the conversation's latest message, and the
+        count is only stored if no message arrived in between (each send does
+        its own $inc), otherwise it is recounted. A cursor never moves
+        backwards; returns the unread count, or None if the cursor was already
+        past this message.
+        """
+        user_id = str(user_id)
+        read_field = f"read_state.{user_id}.last_read_at"
+        read_id_field = f"read_state.{user_id}.last_read_id"
+        message_key = (message["created_at"], message["_id"])
+
+        for attempt in range(attempts):
+            convo = g.db.chat_conversations.find_one(
+                {"_id": ObjectId(conversation_id)},
+                {"last_message_at": 1, "last_message_id": 1, f"read_state.{user_id}": 1}
+            )
+            if not convo:
+                return None
+            # Messages sent in the same millisecond are ordered by _id, as in history pages
+            read_state = convo.get("read_state", {}).get(user_id, {})
+            last_read_at, last_read_id = read_state.get("last_read_at"), read_state.get("last_read_id")
+            if last_read_at is not None and (
+                last_read_at > message_key[0] if last_read_id is None else (last_read_at, last_read_id) > message_key
+            ):
+                return None
+
+            latest = (convo.get("last_message_at"), convo.get("last_message_id"))
+            until = latest if latest[1] is not None else None
+            unread = ChatMessage.count_after(conversation_id, message, user_id, until=until)
+
+            query = {
+                "_id": ObjectId(conversation_id),
+                "$or": [
+                    {read_field: {"$exists": False}},
+                    {read_field: {"$lt": message_key[0]}},
+                    {read_field: message_key[0], read_id_field: {"$lte": message_key[1]}},
+                    {read_field: message_key[0], read_id_field: {"$exists": False}}
+                ]
+            }
+            if attempt < attempts - 1:
+                # Store only if no message arrived since the read; the last attempt stores regardless
+                query.update({"last_message_at": latest[0], "last_message_id": latest[1]})
+
+            result = g.db.chat_conversations.update_one(query, {
+                "$set": {
+                    f"read_state.{user_id}": {
+                        "last_read_at": message["created_at"],
+                        "last_read_id": message["_id"]
+                    },
+                    f"unread_counts.{user_id}": unread
+                }
+            })
+            if result.matched_count:
+                return unread
+
+        return None
+
 
 class ChatMessage:
     @staticmethod
-    def create(conversation_id: str, sender_id: str, text: str, client_id: str = None):
+    def create(conversation_id: str, sender_id: str, text: str, client_id: str = None, convo: dict = None):
+        """Store a message, update the conversation's inbox fields and unread counts, and publish it
+
+        Pass the conversation when already loaded to save a read.
+        """
+        if convo is None:
+            convo = g.db.chat_conversations.find_one(
+                {"_id": ObjectId(conversation_id)},
+                {"participants": 1, "participant_usernames": 1}
+            ) or {}
+        participants = convo.get("participants", [])
+        sender_username = ChatConversation.resolve_usernames(convo, [sender_id]).get(str(sender_id), "User")
+
+        # BSON dates keep milliseconds; truncate so pushed timestamps match stored ones for `since`
+        created_at = datetime.utcnow()
+        created_at = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
         message_data = {
             "conversation_id": ObjectId(conversation_id),
             "sender_id": ObjectId(sender_id),
             "text": text,
             "client_id": client_id,
-            "created_at": datetime.utcnow()
+            "created_at": created_at
         }
-        result = g.db.chat_messages.insert_one(message_data)
+        message_id, created = ChatMessage._insert_once(message_data)
+        if not created:
+            # A retry of a send that already went through
+            return str(message_id)
 
-        g.db.chat_conversations.update_one(
-            {"_id": ObjectId(conversation_id)},
-            {
-                "$set": {
-                    "last_message_at": message_data["created_at"],
-                    "last_message_sender_id": ObjectId(sender_id)
-                }
+        # Sending counts as reading up to your own message
+        update = {
+            "$set": {
+                "last_message_at": message_data["created_at"],
+                "last_message_id": message_id,
+                "last_message_sender_id": ObjectId(sender_id),
+                "last_message_sender_username": sender_username,
+                "last_message_preview": text[:config.CHAT_PREVIEW_LENGTH],
+                f"read_state.{sender_id}": {
+                    "last_read_at": message_data["created_at"],
+                    "last_read_id": message_id
+                },
+                f"unread_counts.{sender_id}": 0
             }
-        )
+        }
+        recipients = [participant_id for participant_id in participants if participant_id != str(sender_id)]
+        if recipients:
+            update["$inc"] = {f"unread_counts.{participant_id}": 1 for participant_id in recipients}
 
-        return str(result.inserted_id)
+        g.db.chat_conversations.update_one({"_id": ObjectId(conversation_id)}, update)
+
+        ChatMessage._publish(conversation_id, ChatMessage.serialize(message_data, sender_username))
+
+        return str(message_id)
+
+    @staticmethod
+    def _insert_once(message_data: dict):
+        """Insert a message unless the sender already sent this client_id, returns (message_id, created)
+
+        With a client_id this is a single upsert against the unique
+        (conversation_id, sender_id, client_id) index; a match hands back the
+        original message instead of inserting a duplicate.
+        """
+        if config.CHAT_BUCKETS_ENABLED:
+            return ChatBucket.append(message_data)
+
+        if not message_data.get("client_id"):
+            return g.db.chat_messages.insert_one(message_data).inserted_id, True
+
+        key = {field: message_data[field] for field in ("conversation_id", "sender_id", "client_id")}
+        message_data["_id"] = ObjectId()
+        try:
+            existing = g.db.chat_messages.find_one_and_update(
+                key,
+                {"$setOnInsert": message_data},
+                projection={"_id": 1},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Two retries raced on the upsert; the other one inserted it
+            existing = g.db.chat_messages.find_one(key, {"_id": 1})
+
+        if existing:
+            return existing["_id"], False
+        return message_data["_id"], True
+
+    @staticmethod
+    def _publish(conversation_id: str, message: dict):
+        # Push to open streams; a failure here must not fail the send, clients can still poll
+        try:
+            from services.chat_pubsub_service import conversation_channel, get_broker
+            get_broker().publish(conversation_channel(conversation_id), message)
+        except Exception as e:
+            logging.error(f"Error publishing chat message: {e}")
+
+    @staticmethod
+    def serialize(message: dict, sender_username: str = "User"):
+        """Convert a message for JSON"""
+        return {
+            "_id": str(message["_id"]),
+            "conversation_id": str(message["conversation_id"]),
+            "sender_id": str(message["sender_id"]),
+            "sender_username": sender_username,
+            "text": message["text"],
+            "client_id": message.get("client_id"),
+            "created_at": message["created_at"].isoformat()
+        }
+
+    @staticmethod
+    def get_by_id(conversation_id: str, message_id: str):
+        """Find a message in the active layout, falling back to the cold archive"""
+        if config.CHAT_BUCKETS_ENABLED:
+            message = ChatBucket.get_by_id(conversation_id, message_id)
+        else:
+            message = g.db.chat_messages.find_one({
+                "_id": ObjectId(message_id),
+                "conversation_id": ObjectId(conversation_id)
+            })
+
+        if message is None and config.CHAT_ARCHIVE_AFTER_DAYS > 0:
+            message = ChatBucket.get_archived_by_id(conversation_id, message_id)
+        return message
 
     @staticmethod
     def get_messages(conversation_id: str, since: datetime = None, limit: int = 50):
+        """Get messages after `since` oldest first, for catching up"""
+        if config.CHAT_BUCKETS_ENABLED:
+            return ChatBucket.get_messages(conversation_id, since, limit)
+
         query = {"conversation_id": ObjectId(conversation_id)}
         if since:
             query["created_at"] = {"$gt": since}
 
-        cursor = g.db.chat_messages.find(query).sort("created_at", 1).limit(limit)
+        cursor = g.db.chat_messages.find(query).sort([("created_at", ASCENDING), ("_id", ASCENDING)]).limit(limit)
         return list(cursor)
+
+    @staticmethod
+    def get_history(conversation_id: str, before: str = None, limit: int = 50):
+        """Get the newest messages, or those just before a cursor, returned oldest first
+
+        Reads the (conversation_id, created_at, _id) index backwards, so the
+        cost depends on the page size and not on how long the conversation is.
+        Returns (messages, before_cursor) where before_cursor loads the
+        previous page, or None at the start of the conversation.
+        """
+        if config.CHAT_BUCKETS_ENABLED:
+            messages, before_cursor = ChatBucket.get_history(conversation_id, before, limit)
+        else:
+            messages, before_cursor = ChatMessage._get_document_history(conversation_id, before, limit)
+
+        # Ran out of recent messages: continue into the archive, which only holds older ones
+        if before_cursor is None and config.CHAT_ARCHIVE_AFTER_DAYS > 0:
+            if messages:
+                edge = (messages[0]["created_at"], messages[0]["_id"])
+            else:
+                edge = decode_cursor(before) if before else None
+            older, before_cursor = ChatBucket.get_archived_history(conversation_id, edge, limit - len(messages))
+            messages = older + messages
+
+        return messages, before_cursor
+
+    @staticmethod
+    def _get_document_history(conversation_id: str, before: str, limit: int):
+        query = {"conversation_id": ObjectId(conversation_id)}
+        if before:
+            created_at, message_id = decode_cursor(before)
+            query.update(keyset_filter("created_at", created_at, message_id))
+
+        messages = list(g.db.chat_messages.find(query).sort(
+            [("created_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit))
+
+        before_cursor = None
+        if messages and len(messages) == limit:
+            before_cursor = encode_cursor(messages[-1]["created_at"], messages[-1]["_id"])
+
+        messages.reverse()
+        return messages, before_cursor
+
+    @staticmethod
+    def count_after(conversation_id: str, message: dict, exclude_sender_id: str, until: tuple = None):
+        """Count messages after `message`, and up to the (created_at, _id) `until` key if given, not sent by `exclude_sender_id`"""
+        if config.CHAT_BUCKETS_ENABLED:
+            return ChatBucket.count_after(conversation_id, message, exclude_sender_id, until)
+
+        bounds = [keyset_filter("created_at", message["created_at"], message["_id"], direction=1)]
+        if until:
+            bounds.append({"$or": [
+                {"created_at": {"$lt": until[0]}},
+                {"created_at": until[0], "_id": {"$lte": until[1]}}
+            ]})
+        return g.db.chat_messages.count_documents({
+            "conversation_id": ObjectId(conversation_id),
+            "sender_id": {"$ne": ObjectId(exclude_sender_id)},
+            "$and": bounds
+        })
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for chat messages"""
+        create_index(
+            db.chat_messages,
+            [("conversation_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+        )
+        # Retried sends carry the same client_id; messages without one are not constrained
+        create_index(
+            db.chat_messages,
+            [("conversation_id", ASCENDING), ("sender_id", ASCENDING), ("client_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"client_id": {"$type": "string"}}
+        )
+        ChatBucket.ensure_indexes(db)
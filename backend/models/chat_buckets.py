@@ -0,0 +1,324 @@
+from datetime import datetime
+from bson import ObjectId
+from flask import g
+from pymongo import ASCENDING, DESCENDING
+from config import config
+from models.database import create_index, drop_index
+from models.pagination import decode_cursor, encode_cursor
+
+
+def _message_key(message):
+    return message["created_at"], message["_id"]
+
+
+class ChatBucket:
+    """Bucket layout for chat messages (CHAT_BUCKETS_ENABLED) and the cold archive
+
+    Each chat_message_buckets document holds up to CHAT_BUCKET_SIZE messages
+    of one conversation plus the time range they cover, so a page of history
+    is one or two document reads instead of one per message. Messages past
+    CHAT_ARCHIVE_AFTER_DAYS are compacted into chat_message_archive in the
+    same shape, up to CHAT_BUCKET_SIZE messages per document and never
+    spanning two months.
+    """
+
+    @staticmethod
+    def append(message_data: dict):
+        """Push a message onto the conversation's open bucket, returns (message_id, created)"""
+        conversation_id = message_data["conversation_id"]
+
+        # Array entries cannot be unique-indexed within a document, so retries are found with a lookup
+        if message_data.get("client_id"):
+            match = {"sender_id": message_data["sender_id"], "client_id": message_data["client_id"]}
+            existing = g.db.chat_message_buckets.find_one(
+                {"conversation_id": conversation_id, "messages": {"$elemMatch": match}},
+                {"messages": {"$elemMatch": match}}
+            )
+            if existing:
+                return existing["messages"][0]["_id"], False
+
+        message_data["_id"] = ObjectId()
+        message = {field: value for field, value in message_data.items() if field != "conversation_id"}
+        # Migrated buckets are closed: migrate resumes after their newest message, so live ones must go elsewhere
+        g.db.chat_message_buckets.update_one(
+            {"conversation_id": conversation_id, "count": {"$lt": config.CHAT_BUCKET_SIZE}, "closed": {"$ne": True}},
+            {
+                "$push": {"messages": message},
+                "$inc": {"count": 1},
+                "$min": {"start_at": message["created_at"]},
+                "$max": {"end_at": message["created_at"]}
+            },
+            upsert=True
+        )
+        return message_data["_id"], True
+
+    @staticmethod
+    def get_by_id(conversation_id: str, message_id: str):
+        return ChatBucket._get_by_id(g.db.chat_message_buckets, conversation_id, message_id)
+
+    @staticmethod
+    def get_archived_by_id(conversation_id: str, message_id: str):
+        return ChatBucket._get_by_id(g.db.chat_message_archive, conversation_id, message_id)
+
+    @staticmethod
+    def _get_by_id(collection, conversation_id: str, message_id: str):
+        bucket = collection.find_one(
+            {"conversation_id": ObjectId(conversation_id), "messages._id": ObjectId(message_id)},
+            {"messages": {"$elemMatch": {"_id": ObjectId(message_id)}}}
+        )
+        if not bucket:
+            return None
+        return dict(bucket["messages"][0], conversation_id=ObjectId(conversation_id))
+
+    @staticmethod
+    def get_messages(conversation_id: str, since: datetime = None, limit: int = 50):
+        """Get messages after `since` oldest first"""
+        query = {"conversation_id": ObjectId(conversation_id)}
+        if since:
+            query["end_at"] = {"$gt": since}
+
+        return ChatBucket._page(
+            g.db.chat_message_buckets,
+            query,
+            [("start_at", ASCENDING)],
+            lambda message: since is None or message["created_at"] > since,
+            limit,
+            newest_first=False
+        )
+
+    @staticmethod
+    def get_history(conversation_id: str, before: str = None, limit: int = 50):
+        """Get the newest messages, or those before a cursor, oldest first; returns (messages, before_cursor)"""
+        before_key = decode_cursor(before) if before else None
+        return ChatBucket._history(g.db.chat_message_buckets, conversation_id, before_key, limit)
+
+    @staticmethod
+    def get_archived_history(conversation_id: str, before_key: tuple = None, limit: int = 50):
+        """Like get_history, over the cold archive; before_key is a (created_at, _id) pair"""
+        return ChatBucket._history(g.db.chat_message_archive, conversation_id, before_key, limit)
+
+    @staticmethod
+    def _history(collection, conversation_id: str, before_key: tuple, limit: int):
+        query = {"conversation_id": ObjectId(conversation_id)}
+        if before_key:
+            query["start_at"] = {"$lte": before_key[0]}
+
+        messages = ChatBucket._page(
+            collection,
+            query,
+            [("end_at", DESCENDING)],
+            lambda message: before_key is None or _message_key(message) < before_key,
+            limit,
+            newest_first=True
+        )
+
+        before_cursor = None
+        if messages and len(messages) == limit:
+            before_cursor = encode_cursor(messages[-1]["created_at"], messages[-1]["_id"])
+
+        messages.reverse()
+        return messages, before_cursor
+
+    @staticmethod
+    def count_after(conversation_id: str, message: dict, exclude_sender_id: str, until: tuple = None):
+        """Count messages after `message`, and up to the (created_at, _id) `until` key if given, not sent by `exclude_sender_id`"""
+        created_at, message_id = message["created_at"], message["_id"]
+        bounds = [{"$or": [
+            {"messages.created_at": {"$gt": created_at}},
+            {"messages.created_at": created_at, "messages._id": {"$gt": message_id}}
+        ]}]
+        if until:
+            bounds.append({"$or": [
+                {"messages.created_at": {"$lt": until[0]}},
+                {"messages.created_at": until[0], "messages._id": {"$lte": until[1]}}
+            ]})
+        pipeline = [
+            {"$match": {"conversation_id": ObjectId(conversation_id), "end_at": {"$gte": created_at}}},
+            {"$unwind": "$messages"},
+            {"$match": {
+                "messages.sender_id": {"$ne": ObjectId(exclude_sender_id)},
+                "$and": bounds
+            }},
+            {"$count": "count"}
+        ]
+        result = list(g.db.chat_message_buckets.aggregate(pipeline))
+        return result[0]["count"] if result else 0
+
+    @staticmethod
+    def _page(collection, query: dict, bucket_sort: list, keep, limit: int, newest_first: bool):
+        # Buckets arrive ordered by the edge nearest the page, so once a full
+        # page is collected, a bucket starting beyond its last message ends the scan
+        boundary = "end_at" if newest_first else "start_at"
+        messages = []
+        for bucket in collection.find(query).sort(bucket_sort).batch_size(2):
+            if len(messages) >= limit:
+                messages.sort(key=_message_key, reverse=newest_first)
+                edge = messages[limit - 1]["created_at"]
+                if (bucket[boundary] < edge) if newest_first else (bucket[boundary] > edge):
+                    break
+            for message in bucket["messages"]:
+                if keep(message):
+                    messages.append(dict(message, conversation_id=bucket["conversation_id"]))
+
+        messages.sort(key=_message_key, reverse=newest_first)
+        return messages[:limit]
+
+    @staticmethod
+    def migrate(db, batch_size: int = 500):
+        """Copy chat_messages into buckets, continuing after each conversation's last migrated bucket
+
+        Safe to re-run, including right after enabling CHAT_BUCKETS_ENABLED to
+        pick up messages written in between: only messages newer than the
+        migrated buckets are copied. Source documents are left in place.
+        """
+        copied = 0
+        for conversation_id in db.chat_messages.distinct("conversation_id"):
+            query = {"conversation_id": conversation_id}
+            latest = db.chat_message_buckets.find_one(
+                {"conversation_id": conversation_id, "migrated": True},
+                sort=[("end_at", DESCENDING)]
+            )
+            if latest:
+                last_key = max(_message_key(message) for message in latest["messages"])
+                query["$or"] = [
+                    {"created_at": {"$gt": last_key[0]}},
+                    {"created_at": last_key[0], "_id": {"$gt": last_key[1]}}
+                ]
+
+            bucket = []
+            for message in db.chat_messages.find(query).sort(
+                [("created_at", ASCENDING), ("_id", ASCENDING)]
+            ).batch_size(batch_size):
+                bucket.append({field: value for field, value in message.items() if field != "conversation_id"})
+                if len(bucket) == config.CHAT_BUCKET_SIZE:
+                    ChatBucket._insert_bucket(db, conversation_id, bucket)
+                    copied += len(bucket)
+                    bucket = []
+            if bucket:
+                ChatBucket._insert_bucket(db, conversation_id, bucket)
+                copied += len(bucket)
+
+        return copied
+
+    @staticmethod
+    def archive(db, older_than: datetime, batch_size: int = 500):
+        """Move messages older than `older_than` into chat_message_archive
+
+        Covers both layouts. Sources are deleted after the archive write, and
+        re-running after an interruption does not duplicate messages.
+        Returns the number of source documents moved.
+        """
+        moved = 0
+
+        # Buckets are picked by their newest message: migrated buckets get an _id at migration time
+        while True:
+            buckets = list(db.chat_message_buckets.find(
+                {"end_at": {"$lt": older_than}}
+            ).limit(batch_size))
+            if not buckets:
+                break
+            ChatBucket._archive_messages(db, [
+                (bucket["conversation_id"], message) for bucket in buckets for message in bucket["messages"]
+            ])
+            result = db.chat_message_buckets.delete_many({"_id": {"$in": [bucket["_id"] for bucket in buckets]}})
+            moved += result.deleted_count
+
+        # _id embeds the insert time, so the default _id index finds old documents
+        id_cutoff = ObjectId.from_datetime(older_than)
+        while True:
+            messages = list(db.chat_messages.find(
+                {"_id": {"$lt": id_cutoff}, "created_at": {"$lt": older_than}}
+            ).limit(batch_size))
+            if not messages:
+                break
+            ChatBucket._archive_messages(db, [
+                (message["conversation_id"], {field: value for field, value in message.items() if field != "conversation_id"})
+                for message in messages
+            ])
+            result = db.chat_messages.delete_many({"_id": {"$in": [message["_id"] for message in messages]}})
+            moved += result.deleted_count
+
+        return moved
+
+    @staticmethod
+    def _archive_messages(db, items: list):
+        groups = {}
+        for conversation_id, message in items:
+            groups.setdefault((conversation_id, message["created_at"].strftime("%Y-%m")), []).append(message)
+
+        for (conversation_id, month), messages in groups.items():
+            # Skip messages a previous, interrupted run already archived
+            ids = [message["_id"] for message in messages]
+            archived = set()
+            for bucket in db.chat_message_archive.find(
+                {"conversation_id": conversation_id, "messages._id": {"$in": ids}},
+                {"messages._id": 1}
+            ):
+                archived.update(message["_id"] for message in bucket["messages"])
+            messages = sorted((message for message in messages if message["_id"] not in archived), key=_message_key)
+            if not messages:
+                continue
+
+            # Fill the month's open document first, then start new ones
+            open_bucket = db.chat_message_archive.find_one(
+                {"conversation_id": conversation_id, "month": month, "count": {"$lt": config.CHAT_BUCKET_SIZE}},
+                {"count": 1}
+            )
+            if open_bucket:
+                chunk = messages[:config.CHAT_BUCKET_SIZE - open_bucket["count"]]
+                result = db.chat_message_archive.update_one(
+                    {"_id": open_bucket["_id"], "count": open_bucket["count"]},
+                    {
+                        "$push": {"messages": {"$each": chunk}},
+                        "$inc": {"count": len(chunk)},
+                        "$min": {"start_at": chunk[0]["created_at"]},
+                        "$max": {"end_at": chunk[-1]["created_at"]}
+                    }
+                )
+                if result.modified_count:
+                    messages = messages[len(chunk):]
+
+            new_buckets = [
+                {
+                    "conversation_id": conversation_id,
+                    "month": month,
+                    "count": len(chunk),
+                    "start_at": chunk[0]["created_at"],
+                    "end_at": chunk[-1]["created_at"],
+                    "messages": chunk
+                }
+                for chunk in (
+                    messages[start:start + config.CHAT_BUCKET_SIZE]
+                    for start in range(0, len(messages), config.CHAT_BUCKET_SIZE)
+                )
+            ]
+            if new_buckets:
+                db.chat_message_archive.insert_many(new_buckets, ordered=False)
+
+    @staticmethod
+    def _insert_bucket(db, conversation_id, messages: list):
+        db.chat_message_buckets.insert_one({
+            "conversation_id": conversation_id,
+            "count": len(messages),
+            "start_at": messages[0]["created_at"],
+            "end_at": messages[-1]["created_at"],
+            "messages": messages,
+            "migrated": True,
+            "closed": True
+        })
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for chat message buckets"""
+        create_index(db.chat_message_buckets, [("conversation_id", ASCENDING), ("end_at", DESCENDING)])
+        create_index(db.chat_message_buckets, [("conversation_id", ASCENDING), ("start_at", ASCENDING)])
+        create_index(db.chat_message_buckets, [("end_at", ASCENDING)])
+        create_index(db.chat_message_buckets, [("conversation_id", ASCENDING), ("messages._id", ASCENDING)])
+        create_index(
+            db.chat_message_buckets,
+            [("conversation_id", ASCENDING), ("messages.sender_id", ASCENDING), ("messages.client_id", ASCENDING)]
+        )
+        create_index(db.chat_message_archive, [("conversation_id", ASCENDING), ("month", ASCENDING), ("count", ASCENDING)])
+        drop_index(db.chat_message_archive, "conversation_id_1_month_1")  # one document per month is no longer unique
+        create_index(db.chat_message_archive, [("conversation_id", ASCENDING), ("end_at", DESCENDING)])
+        create_index(db.chat_message_archive, [("conversation_id", ASCENDING), ("messages._id", ASCENDING)])
@@ -1,8 +1,18 @@
-from datetime import datetime
+import logging
+import math
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from flask import g
+from config import config
+from models.database import create_index, drop_index
+from models.pagination import InvalidCursorError, decode_cursor, encode_cursor, keyset_filter
 
 class CommunityPost:
+    # Set by ensure_indexes once the unique (post_id, user_id) like/star indexes exist
+    _interactions_unique = False
+
     @staticmethod
     def create(user_id: str, mood: str, activity_title: str, activity_description: str, 
                activity_type: str, mood_intensity: int, description: str = None, note: str = None,
@@ -24,6 +34,7 @@ class CommunityPost:
             'likes': 0,
             'stars': 0,
             'comments_count': 0,
+            'trending_score': config.TRENDING_NEW_POST_SCORE,
             'user_username': None  
         }
         
@@ -32,11 +43,21 @@ class CommunityPost:
             post_data['user_username'] = user.get('username', 'Anonymous')
         
         result = g.db.community_posts.insert_one(post_data)
+
+        if is_public:
+            from services.feed_cache_service import FeedCacheService
+            FeedCacheService.invalidate(post_data['mood'], activity_type)
+
         return str(result.inserted_id)
 
     @staticmethod
-    def get_posts(limit: int = 20, skip: int = 0, mood_filter: str = None, activity_type_filter: str = None):
-        """Get community posts with optional filters"""
+    def get_posts(limit: int = 20, skip: int = 0, mood_filter: str = None, activity_type_filter: str = None,
+                  cursor: str = None):
+        """Get community posts with optional filters, newest first
+
+        Pass the cursor from the previous page to continue after its last post
+        without skipping over earlier results.
+        """
         query = {'is_public': True}
         
         if mood_filter:
@@ -44,9 +65,297 @@ class CommunityPost:
         
         if activity_type_filter:
             query['activity_type'] = activity_type_filter
-        
-        cursor = g.db.community_posts.find(query).sort('created_at', -1).skip(skip).limit(limit)
-        return list(cursor)
+
+        if cursor:
+            created_at, post_id = decode_cursor(cursor)
+            query.update(keyset_filter('created_at', created_at, post_id))
+            skip = 0
+        
+        results = g.db.community_posts.find(query).sort(
+            [('created_at', DESCENDING), ('_id', DESCENDING)]
+        ).skip(skip).limit(limit)
+        return list(results)
+
+    @staticmethod
+    def get_trending_posts(limit: int = 20, mood_filter: str = None, activity_type_filter: str = None,
+                           cursor: str = None):
+        """Get public posts by decayed trending score, returns (posts, next_cursor)"""
+        query = {'is_public': True}
+
+        if mood_filter:
+            query['mood'] = mood_filter.lower()
+
+        if activity_type_filter:
+            query['activity_type'] = activity_type_filter
+
+        log_scale = CommunityPost._trending_log_scale(g.db)
+
+        if cursor:
+            value, post_id = decode_cursor(cursor)
+            try:
+                score, cursor_log_scale = float(value[0]), float(value[1])
+            except (TypeError, ValueError, IndexError, KeyError):
+                raise InvalidCursorError("Invalid cursor")
+            # Rescale to the current units if the decay job ran since the cursor was issued
+            score *= math.exp(log_scale - cursor_log_scale)
+            query.update(keyset_filter('trending_score', score, post_id))
+
+        posts = list(g.db.community_posts.find(query).sort(
+            [('trending_score', DESCENDING), ('_id', DESCENDING)]
+        ).limit(limit))
+
+        next_cursor = None
+        if posts and len(posts) == limit:
+            last = posts[-1]
+            next_cursor = encode_cursor([last.get('trending_score', 0), log_scale], last['_id'])
+
+        return posts, next_cursor
+
+    @staticmethod
+    def search_posts(text: str, limit: int = 20, mood_filter: str = None, activity_type_filter: str = None,
+                     cursor: str = None):
+        """Full-text search over public posts, best match first, returns (posts, next_cursor)
+
+        Uses the post_text_search index; each post gets its text `score`.
+        """
+        match = {'is_public': True, '$text': {'$search': text}}
+
+        if mood_filter:
+            match['mood'] = mood_filter.lower()
+
+        if activity_type_filter:
+            match['activity_type'] = activity_type_filter
+
+        pipeline = [
+            {'$match': match},
+            {'$addFields': {'score': {'$meta': 'textScore'}}}
+        ]
+        if cursor:
+            score, post_id = decode_cursor(cursor)
+            pipeline.append({'$match': keyset_filter('score', score, post_id)})
+        pipeline += [
+            {'$sort': {'score': DESCENDING, '_id': DESCENDING}},
+            {'$limit': limit}
+        ]
+
+        posts = list(g.db.community_posts.aggregate(pipeline))
+
+        next_cursor = None
+        if posts and len(posts) == limit:
+            next_cursor = encode_cursor(posts[-1]['score'], posts[-1]['_id'])
+
+        return posts, next_cursor
+
+    @staticmethod
+    def get_posts_since(cursor: str, limit: int = 50, mood_filter: str = None, activity_type_filter: str = None):
+        """Get posts newer than the cursor, oldest first so the next call can continue from the last one"""
+        query = {'is_public': True}
+
+        if mood_filter:
+            query['mood'] = mood_filter.lower()
+
+        if activity_type_filter:
+            query['activity_type'] = activity_type_filter
+
+        created_at, post_id = decode_cursor(cursor)
+        query.update(keyset_filter('created_at', created_at, post_id, direction=1))
+
+        results = g.db.community_posts.find(query).sort(
+            [('created_at', ASCENDING), ('_id', ASCENDING)]
+        ).limit(limit)
+        return list(results)
+
+    @staticmethod
+    def get_counters(post_ids: list, changed_since: datetime = None):
+        """Get likes, stars and comments_count for the given posts, optionally only those changed since a time"""
+        if not post_ids:
+            return {}
+
+        query = {'_id': {'$in': [ObjectId(post_id) for post_id in post_ids]}}
+        if changed_since:
+            query['counters_updated_at'] = {'$gt': changed_since}
+
+        projection = {'likes': 1, 'stars': 1, 'comments_count': 1}
+        return {
+            str(post['_id']): {
+                'likes': post.get('likes', 0),
+                'stars': post.get('stars', 0),
+                'comments_count': post.get('comments_count', 0)
+            }
+            for post in g.db.community_posts.find(query, projection)
+        }
+
+    @staticmethod
+    def increment_counters(post_id: str, **deltas):
+        """Apply counter deltas (likes, stars, comments_count) to a post and stamp the change time
+
+        Returns whether the post exists, or None when the write is buffered.
+        """
+        trending_delta = sum(
+            CommunityPost._trending_weights().get(field, 0) * delta for field, delta in deltas.items()
+        )
+        if trending_delta:
+            deltas['trending_score'] = trending_delta
+
+        # Hot posts: accumulate per worker and write in periodic bulk batches
+        if config.COUNTER_BUFFER_ENABLED:
+            from services.counter_service import post_counter_buffer
+            post_counter_buffer.add(post_id, **deltas)
+            return None
+
+        result = g.db.community_posts.update_one(
+            {'_id': ObjectId(post_id)},
+            {
+                '$inc': deltas,
+                '$set': {'counters_updated_at': datetime.utcnow()}
+            }
+        )
+        return result.matched_count > 0
+
+    @staticmethod
+    def _trending_weights():
+        return {
+            'likes': config.TRENDING_LIKE_WEIGHT,
+            'stars': config.TRENDING_STAR_WEIGHT,
+            'comments_count': config.TRENDING_COMMENT_WEIGHT
+        }
+
+    @staticmethod
+    def _trending_log_scale(db) -> float:
+        """Sum of the log decay factors applied so far"""
+        state = db.maintenance_state.find_one({'_id': 'trending_decay'})
+        return state.get('log_scale', 0.0) if state else 0.0
+
+    @staticmethod
+    def decay_trending_scores(db, batch_size: int = 500, stale_after: timedelta = timedelta(hours=1)):
+        """Decay every trending score by the time elapsed since the last run
+
+        Interactions add their weight to trending_score as they happen, so after
+        this job a score is the sum of its interaction weights halved once per
+        TRENDING_HALF_LIFE_HOURS of age. Scores that would fall below
+        TRENDING_MIN_SCORE are set to 0 and left alone by later runs. Posts
+        without a score are backfilled from their counters and creation time.
+
+        Returns None without changing anything when another run holds the
+        claim; a claim is taken over once it is older than `stale_after`.
+        """
+        now = datetime.utcnow()
+        half_life = config.TRENDING_HALF_LIFE_HOURS
+        weights = CommunityPost._trending_weights()
+
+        # Claim the run before reading decayed_at, so overlapping runs cannot apply the same decay twice
+        db.maintenance_state.update_one({'_id': 'trending_decay'}, {'$setOnInsert': {'log_scale': 0.0}}, upsert=True)
+        state = db.maintenance_state.find_one_and_update(
+            {'_id': 'trending_decay', '$or': [{'claimed_at': None}, {'claimed_at': {'$lt': now - stale_after}}]},
+            {'$set': {'claimed_at': now}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if state is None:
+            logging.warning("Trending decay is already running, skipping this run")
+            return None
+
+        elapsed_hours = (now - state['decayed_at']).total_seconds() / 3600 if state.get('decayed_at') else 0.0
+        factor = 0.5 ** (elapsed_hours / half_life)
+        # Scores below this fall under TRENDING_MIN_SCORE once decayed
+        zero_below = config.TRENDING_MIN_SCORE / factor
+
+        projection = {'trending_score': 1, 'created_at': 1, 'likes': 1, 'stars': 1, 'comments_count': 1}
+        updated = 0
+        last_id = None
+
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            posts = list(db.community_posts.find(query, projection).sort('_id', ASCENDING).limit(batch_size))
+            if not posts:
+                break
+            first_id, last_id = posts[0]['_id'], posts[-1]['_id']
+
+            if factor < 1:
+                id_range = {'$gte': first_id, '$lte': last_id}
+                result = db.community_posts.update_many(
+                    {'_id': id_range, 'trending_score': {'$gte': zero_below}},
+                    {'$mul': {'trending_score': factor}}
+                )
+                updated += result.modified_count
+                result = db.community_posts.update_many(
+                    {'_id': id_range, 'trending_score': {'$gt': 0, '$lt': zero_below}},
+                    {'$set': {'trending_score': 0}}
+                )
+                updated += result.modified_count
+
+            backfill = []
+            for post in posts:
+                if 'trending_score' in post:
+                    continue
+                age_hours = (now - post['created_at']).total_seconds() / 3600
+                score = config.TRENDING_NEW_POST_SCORE + sum(
+                    weight * post.get(field, 0) for field, weight in weights.items()
+                )
+                backfill.append(UpdateOne(
+                    {'_id': post['_id'], 'trending_score': {'$exists': False}},
+                    {'$set': {'trending_score': score * 0.5 ** (age_hours / half_life)}}
+                ))
+            if backfill:
+                updated += db.community_posts.bulk_write(backfill, ordered=False).modified_count
+
+        # Cursors issued before this run carry the old scale and are rescaled on use
+        db.maintenance_state.update_one(
+            {'_id': 'trending_decay', 'claimed_at': now},
+            {'$set': {'decayed_at': now}, '$inc': {'log_scale': math.log(factor)}, '$unset': {'claimed_at': ''}}
+        )
+        return updated
+
+    @staticmethod
+    def remove_duplicate_interactions(db):
+        """Delete repeated (post_id, user_id) likes and stars so the unique indexes can be built"""
+        removed = 0
+        for collection in (db.post_likes, db.post_stars):
+            pipeline = [
+                {'$group': {
+                    '_id': {'post_id': '$post_id', 'user_id': '$user_id'},
+                    'ids': {'$push': '$_id'},
+                    'count': {'$sum': 1}
+                }},
+                {'$match': {'count': {'$gt': 1}}}
+            ]
+            for group in collection.aggregate(pipeline, allowDiskUse=True):
+                result = collection.delete_many({'_id': {'$in': sorted(group['ids'])[1:]}})
+                removed += result.deleted_count
+        return removed
+
+    @staticmethod
+    def reconcile_counters(db, batch_size: int = 500):
+        """Recompute likes, stars and comments_count from post_likes, post_stars and post_comments"""
+        sources = [('likes', db.post_likes), ('stars', db.post_stars), ('comments_count', db.post_comments)]
+        updated = 0
+        last_id = None
+
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            post_ids = [post['_id'] for post in db.community_posts.find(query, {'_id': 1}).sort('_id', ASCENDING).limit(batch_size)]
+            if not post_ids:
+                return updated
+            last_id = post_ids[-1]
+
+            counts = {post_id: {field: 0 for field, _ in sources} for post_id in post_ids}
+            for field, collection in sources:
+                pipeline = [
+                    {'$match': {'post_id': {'$in': post_ids}}},
+                    {'$group': {'_id': '$post_id', 'count': {'$sum': 1}}}
+                ]
+                for row in collection.aggregate(pipeline):
+                    counts[row['_id']][field] = row['count']
+
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne(
+                    {'_id': post_id, '$or': [{field: {'$ne': value}} for field, value in fields.items()]},
+                    {'$set': dict(fields, counters_updated_at=now)}
+                )
+                for post_id, fields in counts.items()
+            ]
+            result = db.community_posts.bulk_write(operations, ordered=False)
+            updated += result.modified_count
 
     @staticmethod
     def get_user_posts(user_id: str, limit: int = 20):
@@ -62,120 +371,136 @@ class CommunityPost:
         return g.db.community_posts.find_one({'_id': ObjectId(post_id)})
 
     @staticmethod
-    def like_post(post_id: str, user_id: str):
-        """Like a post"""
-        
-        existing_like = g.db.post_likes.find_one({
-            'post_id': ObjectId(post_id),
-            'user_id': ObjectId(user_id)
-        })
-        
-        if existing_like:
-            return False  
-        
-        
-        g.db.post_likes.insert_one({
-            'post_id': ObjectId(post_id),
-            'user_id': ObjectId(user_id),
-            'created_at': datetime.utcnow()
-        })
-        
-        
-        g.db.community_posts.update_one(
-            {'_id': ObjectId(post_id)},
-            {'$inc': {'likes': 1}}
-        )
-        
+    def _add_interaction(collection, post_id: str, user_id: str, counter: str):
+        """Insert a like/star and bump the counter only if this call created it
+
+        Returns True when added, False when the user already had one and None
+        when the post does not exist. The unique (post_id, user_id) index makes
+        concurrent taps safe without a read first.
+        """
+        post_oid = ObjectId(post_id)
+
+        # Buffered increments cannot report a missing post, so check up front
+        if config.COUNTER_BUFFER_ENABLED and not g.db.community_posts.find_one({'_id': post_oid}, {'_id': 1}):
+            return None
+
+        # Until the unique index exists the insert cannot reject a repeat, so look for one first
+        if not CommunityPost._interactions_unique and collection.find_one(
+            {'post_id': post_oid, 'user_id': ObjectId(user_id)}, {'_id': 1}
+        ):
+            return False
+
+        try:
+            result = collection.insert_one({
+                'post_id': post_oid,
+                'user_id': ObjectId(user_id),
+                'created_at': datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            return False
+
+        if CommunityPost.increment_counters(post_id, **{counter: 1}) is False:
+            collection.delete_one({'_id': result.inserted_id})
+            return None
+
         return True
 
     @staticmethod
-    def unlike_post(post_id: str, user_id: str):
-        """Unlike a post"""
-        result = g.db.post_likes.delete_one({
+    def _remove_interaction(collection, post_id: str, user_id: str, counter: str):
+        """Delete a like/star and decrement the counter only if one was deleted"""
+        result = collection.delete_one({
             'post_id': ObjectId(post_id),
             'user_id': ObjectId(user_id)
         })
-        
+
         if result.deleted_count > 0:
-            g.db.community_posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$inc': {'likes': -1}}
-            )
+            CommunityPost.increment_counters(post_id, **{counter: -1})
             return True
-        
+
         return False
 
+    @staticmethod
+    def like_post(post_id: str, user_id: str):
+        """Like a post, returns None if the post does not exist"""
+        return CommunityPost._add_interaction(g.db.post_likes, post_id, user_id, 'likes')
+
+    @staticmethod
+    def unlike_post(post_id: str, user_id: str):
+        """Unlike a post"""
+        return CommunityPost._remove_interaction(g.db.post_likes, post_id, user_id, 'likes')
+
     @staticmethod
     def star_post(post_id: str, user_id: str):
-        """Star a post (bookmark/favorite)"""
-        
-        existing_star = g.db.post_stars.find_one({
-            'post_id': ObjectId(post_id),
-            'user_id': ObjectId(user_id)
-        })
-        
-        if existing_star:
-            return False 
-        
-        
-        g.db.post_stars.insert_one({
-            'post_id': ObjectId(post_id),
-            'user_id': ObjectId(user_id),
-            'created_at': datetime.utcnow()
-        })
-        
-        
-        g.db.community_posts.update_one(
-            {'_id': ObjectId(post_id)},
-            {'$inc': {'stars': 1}}
-        )
-        
-        return True
+        """Star a post (bookmark/favorite), returns None if the post does not exist"""
+        return CommunityPost._add_interaction(g.db.post_stars, post_id, user_id, 'stars')
 
     @staticmethod
     def unstar_post(post_id: str, user_id: str):
         """Unstar a post"""
-        result = g.db.post_stars.delete_one({
-            'post_id': ObjectId(post_id),
-            'user_id': ObjectId(user_id)
-        })
-        
-        if result.deleted_count > 0:
-            g.db.community_posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$inc': {'stars': -1}}
-            )
-            return True
-        
-        return False
+        return CommunityPost._remove_interaction(g.db.post_stars, post_id, user_id, 'stars')
 
     @staticmethod
-    def get_user_liked_posts(user_id: str, limit: int = 20):
-        """Get posts that a user has liked"""
-        liked_post_ids = g.db.post_likes.find({'user_id': ObjectId(user_id)}).distinct('post_id')
-        
-        if not liked_post_ids:
-            return []
-        
-        cursor = g.db.community_posts.find({
-            '_id': {'$in': liked_post_ids}
-        }).sort('created_at', -1).limit(limit)
-        
-        return list(cursor)
+    def _get_user_interacted_posts(collection, user_id: str, limit: int, cursor: str, time_field: str):
+        """Page through a user's likes/stars newest first, joining only the posts on the page
+
+        Returns (posts, next_cursor); each post gets `time_field` set to when
+        the user liked/starred it. Posts deleted since are left out, so a page
+        can be shorter than limit while next_cursor is still set.
+        """
+        match = {'user_id': ObjectId(user_id)}
+        if cursor:
+            created_at, interaction_id = decode_cursor(cursor)
+            match.update(keyset_filter('created_at', created_at, interaction_id))
+
+        pipeline = [
+            {'$match': match},
+            {'$sort': {'created_at': DESCENDING, '_id': DESCENDING}},
+            {'$limit': limit},
+            {'$lookup': {
+                'from': 'community_posts',
+                'localField': 'post_id',
+                'foreignField': '_id',
+                'as': 'post'
+            }}
+        ]
+        rows = list(collection.aggregate(pipeline))
+
+        posts = []
+        for row in rows:
+            if row['post']:
+                post = row['post'][0]
+                post[time_field] = row['created_at']
+                posts.append(post)
+
+        next_cursor = None
+        if rows and len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['_id'])
+
+        return posts, next_cursor
 
     @staticmethod
-    def get_user_starred_posts(user_id: str, limit: int = 20):
-        """Get posts that a user has starred"""
-        starred_post_ids = g.db.post_stars.find({'user_id': ObjectId(user_id)}).distinct('post_id')
-        
-        if not starred_post_ids:
-            return []
-        
-        cursor = g.db.community_posts.find({
-            '_id': {'$in': starred_post_ids}
-        }).sort('created_at', -1).limit(limit)
-        
-        return list(cursor)
+    def get_user_liked_posts(user_id: str, limit: int = 20, cursor: str = None):
+        """Get posts that a user has liked, most recently liked first, returns (posts, next_cursor)"""
+        return CommunityPost._get_user_interacted_posts(g.db.post_likes, user_id, limit, cursor, 'liked_at')
+
+    @staticmethod
+    def get_user_starred_posts(user_id: str, limit: int = 20, cursor: str = None):
+        """Get posts that a user has starred, most recently starred first, returns (posts, next_cursor)"""
+        return CommunityPost._get_user_interacted_posts(g.db.post_stars, user_id, limit, cursor, 'starred_at')
+
+    @staticmethod
+    def get_user_interaction_status(post_ids: list, user_id: str):
+        """Get the ids of the given posts the user has liked and starred, in two queries"""
+        if not post_ids:
+            return set(), set()
+
+        object_ids = [ObjectId(post_id) for post_id in post_ids]
+        query = {'user_id': ObjectId(user_id), 'post_id': {'$in': object_ids}}
+        projection = {'post_id': 1, '_id': 0}
+
+        liked = {str(like['post_id']) for like in g.db.post_likes.find(query, projection)}
+        starred = {str(star['post_id']) for star in g.db.post_stars.find(query, projection)}
+        return liked, starred
 
     @staticmethod
     def is_post_liked_by_user(post_id: str, user_id: str):
@@ -195,6 +520,60 @@ class CommunityPost:
         })
         return star is not None
 
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for community posts and interactions"""
+        # Feed ordering (recent and trending), one index per combination of the mood/activity_type filters
+        for sort_field in ('created_at', 'trending_score'):
+            for filter_fields in ([], ['mood'], ['activity_type'], ['mood', 'activity_type']):
+                create_index(
+                    db.community_posts,
+                    [('is_public', ASCENDING)]
+                    + [(field, ASCENDING) for field in filter_fields]
+                    + [(sort_field, DESCENDING), ('_id', DESCENDING)]
+                )
+
+        # Only one text index is allowed per collection; the is_public prefix keeps searches to public posts
+        create_index(
+            db.community_posts,
+            [
+                ('is_public', ASCENDING),
+                ('activity_title', TEXT),
+                ('activity_description', TEXT),
+                ('description', TEXT),
+                ('note', TEXT)
+            ],
+            name='post_text_search',
+            weights={'activity_title': 10, 'activity_description': 4, 'description': 2, 'note': 1},
+            default_language='english'
+        )
+
+        # One like/star per user and post; inserts rely on this instead of a read first
+        interactions = (db.post_likes, db.post_stars)
+        unique_key = [('post_id', ASCENDING), ('user_id', ASCENDING)]
+        built = [create_index(collection, unique_key, unique=True) for collection in interactions]
+        if not all(built):
+            # Usually duplicates left by the old check-then-insert toggles; removing them is left to the operator
+            logging.warning(
+                "Unique like/star indexes could not be built, run maintenance.py dedupe-interactions, "
+                "reconcile-counters and ensure-indexes; until then toggles check before inserting"
+            )
+        CommunityPost._interactions_unique = all(built)
+
+        for collection in interactions:
+            create_index(collection, [('user_id', ASCENDING), ('post_id', ASCENDING)])
+            create_index(collection, [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+        create_index(db.post_comments, [('post_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+        drop_index(db.post_comments, 'post_id_1_created_at_-1')  # superseded by the index above
+        create_index(
+            db.post_comments,
+            [('post_id', ASCENDING), ('thread_user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]
+        )
+
+        # Author lookups, used when a rename is copied onto the user's posts and comments
+        create_index(db.community_posts, [('user_id', ASCENDING), ('_id', ASCENDING)])
+        create_index(db.post_comments, [('user_id', ASCENDING), ('_id', ASCENDING)])
+
 class PostComment:
     @staticmethod
     def create(post_id: str, user_id: str, comment: str, thread_user_id: str, parent_comment_id: str = None, is_owner_reply: bool = False):
@@ -217,10 +596,7 @@ class PostComment:
         
         result = g.db.post_comments.insert_one(comment_data)
         
-        g.db.community_posts.update_one(
-            {'_id': ObjectId(post_id)},
-            {'$inc': {'comments_count': 1}}
-        )
+        CommunityPost.increment_counters(post_id, comments_count=1)
         
         return str(result.inserted_id)
 
@@ -231,6 +607,88 @@ class PostComment:
         if thread_user_id:
             query['thread_user_id'] = ObjectId(thread_user_id)
 
-        cursor = g.db.post_comments.find(query).sort('created_at', -1).limit(limit)
+        cursor = g.db.post_comments.find(query).sort([('created_at', DESCENDING), ('_id', DESCENDING)]).limit(limit)
         
-        return list(cursor) 
\ No newline at end of file
+        return list(cursor) 
+
+    @staticmethod
+    def get_thread_summaries(post_id: str, limit: int = 20, cursor: str = None, thread_user_id: str = None):
+        """Summarize a post's comment threads in one aggregation, most recently active first
+
+        Each summary has the thread user, their username, the comment count and
+        the last comment. Returns (threads, next_cursor).
+        """
+        match = {'post_id': ObjectId(post_id)}
+        if thread_user_id:
+            match['thread_user_id'] = ObjectId(thread_user_id)
+
+        pipeline = [
+            {'$match': match},
+            {'$sort': {'created_at': DESCENDING, '_id': DESCENDING}},
+            {'$group': {
+                '_id': '$thread_user_id',
+                'last_comment_at': {'$first': '$created_at'},
+                'last_comment': {'$first': '$$ROOT'},
+                'count': {'$sum': 1},
+                'thread_username': {'$max': {
+                    '$cond': [{'$eq': ['$user_id', '$thread_user_id']}, '$user_username', None]
+                }}
+            }}
+        ]
+        if cursor:
+            last_comment_at, cursor_thread_user_id = decode_cursor(cursor)
+            pipeline.append({'$match': keyset_filter('last_comment_at', last_comment_at, cursor_thread_user_id)})
+        pipeline += [
+            {'$sort': {'last_comment_at': DESCENDING, '_id': DESCENDING}},
+            {'$limit': limit}
+        ]
+
+        threads = list(g.db.post_comments.aggregate(pipeline))
+
+        next_cursor = None
+        if threads and len(threads) == limit:
+            next_cursor = encode_cursor(threads[-1]['last_comment_at'], threads[-1]['_id'])
+
+        return threads, next_cursor
+
+    @staticmethod
+    def get_thread_comments(post_id: str, thread_user_id: str, limit: int = 50, cursor: str = None):
+        """Get one page of a thread's comments newest first, returns (comments, next_cursor)"""
+        query = {'post_id': ObjectId(post_id), 'thread_user_id': ObjectId(thread_user_id)}
+        if cursor:
+            created_at, comment_id = decode_cursor(cursor)
+            query.update(keyset_filter('created_at', created_at, comment_id))
+
+        comments = list(g.db.post_comments.find(query).sort(
+            [('created_at', DESCENDING), ('_id', DESCENDING)]
+        ).limit(limit))
+
+        next_cursor = None
+        if comments and len(comments) == limit:
+            next_cursor = encode_cursor(comments[-1]['created_at'], comments[-1]['_id'])
+
+        return comments, next_cursor
+
+    @staticmethod
+    def build_reply_tree(comments: list):
+        """Nest comments under their parent as `replies` (oldest reply first)
+
+        Comments whose parent is not in the list stay at the top level in their
+        original order, so a page keeps working when the parent is on a later page.
+        """
+        by_id = {comment['_id']: comment for comment in comments}
+        for comment in comments:
+            comment['replies'] = []
+
+        roots = []
+        for comment in comments:
+            parent = by_id.get(comment.get('parent_comment_id'))
+            if parent is not None:
+                parent['replies'].append(comment)
+            else:
+                roots.append(comment)
+
+        for comment in comments:
+            comment['replies'].sort(key=lambda reply: (reply['created_at'], reply['_id']))
+
+        return roots
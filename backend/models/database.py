@@ -0,0 +1,44 @@
+import logging
+import os
+import threading
+from pymongo import MongoClient
+from config import config
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_background_db():
+    """Get the process-wide database handle used by requests and background work"""
+    global _client, _client_pid
+
+    # MongoClient is not fork-safe, so each worker process builds its own
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(config.MONGO_URI)
+                _client_pid = os.getpid()
+
+    return _client.get_default_database()
+
+
+def create_index(collection, keys, **options) -> bool:
+    """Create an index, logging a failure instead of raising so the remaining indexes still get built"""
+    try:
+        collection.create_index(keys, **options)
+        return True
+    except Exception as e:
+        logging.error(f"Could not create index {keys} on {collection.name}: {e}")
+        return False
+
+
+def drop_index(collection, name: str) -> bool:
+    """Drop a superseded index if it exists, logging a failure instead of raising"""
+    try:
+        if name in collection.index_information():
+            collection.drop_index(name)
+        return True
+    except Exception as e:
+        logging.error(f"Could not drop index {name} on {collection.name}: {e}")
+        return False
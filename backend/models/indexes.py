@@ -0,0 +1,53 @@
+import logging
+from pymongo import ASCENDING
+from config import config
+from models.ai_jobs import AIJob
+from models.chat import ChatConversation, ChatMessage
+from models.community_posts import CommunityPost
+from models.database import create_index
+from models.mood_journal import Recommendation
+from models.username_changes import UsernameChange
+
+
+def ensure_indexes(db):
+    """Create the indexes every model relies on (safe to run repeatedly)
+
+    Each index is created on its own and failures are logged, so one index
+    that cannot be built does not keep the others from being created.
+    """
+    Recommendation.ensure_indexes(db)
+    AIJob.ensure_indexes(db)
+    CommunityPost.ensure_indexes(db)
+    ChatConversation.ensure_indexes(db)
+    ChatMessage.ensure_indexes(db)
+    UsernameChange.ensure_indexes(db)
+    ensure_retention_indexes(db)
+
+
+def ensure_retention_indexes(db):
+    """TTL indexes for append-only data that is only useful for a while"""
+    ensure_ttl_index(db, 'recommendation_impressions', 'ts', config.RETENTION_IMPRESSION_DAYS)
+    ensure_ttl_index(db, 'ai_feedback', 'created_at', config.RETENTION_AI_FEEDBACK_DAYS)
+    ensure_ttl_index(db, 'recommendations', 'created_at', config.RETENTION_LEGACY_RECOMMENDATION_DAYS)
+
+
+def ensure_ttl_index(db, collection_name: str, field: str, days: int):
+    """Create or retune a single-field TTL index; days <= 0 drops it so the data is kept"""
+    seconds = days * 86400
+    try:
+        for index in db[collection_name].list_indexes():
+            if list(index['key'].items()) == [(field, ASCENDING)] and 'expireAfterSeconds' in index:
+                if days <= 0:
+                    db[collection_name].drop_index(index['name'])
+                    logging.info(f"Removed {collection_name}.{field} retention, data is now kept")
+                elif index['expireAfterSeconds'] != seconds:
+                    # The expiry of an existing TTL index can only be changed with collMod
+                    db.command('collMod', collection_name, index={'keyPattern': {field: ASCENDING}, 'expireAfterSeconds': seconds})
+                    logging.info(f"Updated {collection_name}.{field} retention to {days} days")
+                return
+    except Exception as e:
+        logging.error(f"Could not update {collection_name}.{field} retention: {e}")
+        return
+
+    if days > 0:
+        create_index(db[collection_name], [(field, ASCENDING)], expireAfterSeconds=seconds)
@@ -1,6 +1,10 @@
+import hashlib
+import json
 from datetime import datetime, timezone
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
 from flask import g
+from models.database import create_index
 
 class MoodEntry:
     @staticmethod
@@ -71,40 +75,67 @@ class MoodEntry:
         return list(g.db.mood_entries.aggregate(pipeline))
 
 class Recommendation:
+    @staticmethod
+    def content_id(activity_type: str, title: str, description: str, url: str = None, category: str = None):
+        """Derive a stable catalog id from the recommendation content"""
+        content = json.dumps([activity_type, title, description, url, category], ensure_ascii=False)
+        return ObjectId(hashlib.sha256(content.encode('utf-8')).digest()[:12])
+
     @staticmethod
     def create(user_id: str, mood: str, activity_type: str, title: str, description: str, 
                url: str = None, category: str = None):
-        """Create a new recommendation"""
-        recommendation_data = {
+        """Record a recommendation in the shared catalog and log the impression"""
+        from services.event_buffer_service import impression_buffer
+
+        item_id = Recommendation.content_id(activity_type, title, description, url, category)
+        now = datetime.now(timezone.utc)
+
+        # Identical content maps to the same catalog item, so repeats only touch the mood set
+        g.db.recommendation_items.update_one(
+            {'_id': item_id},
+            {
+                '$setOnInsert': {
+                    'activity_type': activity_type,
+                    'title': title,
+                    'description': description,
+                    'url': url,
+                    'category': category,
+                    'created_at': now,
+                    'likes': 0,
+                    'dislikes': 0,
+                    'feedback_count': 0
+                },
+                '$addToSet': {'moods': mood.lower()}
+            },
+            upsert=True
+        )
+
+        impression_buffer.add({
             'user_id': ObjectId(user_id),
+            'item_id': item_id,
             'mood': mood.lower(),
-            'activity_type': activity_type,  
-            'title': title,
-            'description': description,
-            'url': url,
-            'category': category,
-            'created_at': datetime.now(timezone.utc),
-            'likes': 0,
-            'dislikes': 0,
-            'feedback_count': 0
-        }
-        result = g.db.recommendations.insert_one(recommendation_data)
-        return str(result.inserted_id)
+            'ts': now
+        })
+        return str(item_id)
 
     @staticmethod
     def get_recommendations_for_mood(mood: str, activity_type: str = None, limit: int = 5):
-        """Get recommendations for a specific mood"""
-        query = {'mood': mood.lower()}
+        """Get the most liked catalog items for a specific mood"""
+        query = {'moods': mood.lower()}
         if activity_type:
             query['activity_type'] = activity_type
             
-        cursor = g.db.recommendations.find(query).sort('likes', -1).limit(limit)
+        cursor = g.db.recommendation_items.find(query).sort('likes', -1).limit(limit)
         return list(cursor)
 
     @staticmethod
     def get_by_id(recommendation_id: str):
         """Get a recommendation by ID"""
         try:
+            item = g.db.recommendation_items.find_one({'_id': ObjectId(recommendation_id)})
+            if item:
+                return item
+            # Recommendations created before the catalog keep their own documents
             return g.db.recommendations.find_one({'_id': ObjectId(recommendation_id)})
         except:
             return None
@@ -123,10 +154,22 @@ class Recommendation:
         else:
             update_data['$inc']['dislikes'] = 1
             
-        g.db.recommendations.update_one(
+        result = g.db.recommendation_items.update_one(
             {'_id': ObjectId(recommendation_id)},
             update_data
         )
+        if result.matched_count == 0:
+            g.db.recommendations.update_one(
+                {'_id': ObjectId(recommendation_id)},
+                update_data
+            )
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for the recommendation catalog and impression log"""
+        create_index(db.recommendation_items, [('moods', ASCENDING), ('likes', DESCENDING)])
+        create_index(db.recommendation_items, [('moods', ASCENDING), ('activity_type', ASCENDING), ('likes', DESCENDING)])
+        create_index(db.recommendation_impressions, [('user_id', ASCENDING), ('ts', DESCENDING)])
 
     @staticmethod
     def get_user_feedback_history(user_id: str):
@@ -145,4 +188,22 @@ class UserFeedback:
             'created_at': datetime.now(timezone.utc)
         }
         result = g.db.user_feedback.insert_one(feedback_data)
-        return str(result.inserted_id) 
\ No newline at end of file
+        return str(result.inserted_id)
+
+class AIFeedback:
+    @staticmethod
+    def create(user_id: str, recommendation_title: str, recommendation_type: str,
+               recommendation_description: str, liked: bool, mood: str):
+        """Queue an append-only feedback event for an AI-generated recommendation"""
+        from services.event_buffer_service import ai_feedback_buffer
+
+        feedback_data = {
+            'user_id': ObjectId(user_id),
+            'recommendation_title': recommendation_title,
+            'recommendation_type': recommendation_type,
+            'recommendation_description': recommendation_description,
+            'liked': liked,
+            'mood': mood.lower(),
+            'created_at': datetime.now(timezone.utc)
+        }
+        ai_feedback_buffer.add(feedback_data) 
\ No newline at end of file
@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, doc_id) -> str:
+    """Build an opaque cursor from the sort key and _id of the last item on a page"""
+    if isinstance(sort_value, datetime):
+        value = {'d': sort_value.isoformat()}
+    else:
+        value = {'v': sort_value}
+
+    payload = json.dumps([value, str(doc_id)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return (sort_value, ObjectId) from a cursor made by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if 'd' in value:
+            return datetime.fromisoformat(value['d']), ObjectId(doc_id)
+        return value['v'], ObjectId(doc_id)
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
+
+
+def keyset_filter(field: str, sort_value, doc_id, direction: int = -1) -> dict:
+    """Match documents after (sort_value, doc_id) in a (field, _id) ordering"""
+    op = '$lt' if direction < 0 else '$gt'
+    return {
+        '$or': [
+            {field: {op: sort_value}},
+            {field: sort_value, '_id': {op: doc_id}}
+        ]
+    }
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from models.database import create_index
+
+
+class UsernameChange:
+    """Pending username propagations, one document per user
+
+    A rename while a propagation is running only bumps requested_at; the
+    running pass then requeues the user when it finishes, so a user is never
+    propagated by two passes at once. A running pass renews claimed_at after
+    every batch; a claim is only taken over once it has not been renewed for
+    `stale_after`, and the pass that lost it stops at its next renewal.
+    """
+
+    @staticmethod
+    def request(db, user_id: str, username: str):
+        """Queue propagation of a user's new username"""
+        db.username_changes.update_one(
+            {'_id': ObjectId(user_id)},
+            {
+                '$set': {'username': username, 'requested_at': datetime.utcnow()},
+                '$setOnInsert': {'status': 'pending'}
+            },
+            upsert=True
+        )
+
+    @staticmethod
+    def claim(db, stale_after: timedelta = timedelta(minutes=10)):
+        """Take the oldest pending change, or one whose worker stopped responding"""
+        now = datetime.utcnow()
+        return db.username_changes.find_one_and_update(
+            {'$or': [
+                {'status': 'pending'},
+                {'status': 'running', 'claimed_at': {'$lt': now - stale_after}}
+            ]},
+            {'$set': {'status': 'running', 'claimed_at': now}},
+            sort=[('requested_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def renew(db, change: dict) -> bool:
+        """Extend the claim on a running change, returns False if another pass has taken it over"""
+        renewed = db.username_changes.find_one_and_update(
+            {'_id': change['_id'], 'status': 'running', 'claimed_at': change['claimed_at']},
+            {'$set': {'claimed_at': datetime.utcnow()}},
+            projection={'claimed_at': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not renewed:
+            return False
+        change['claimed_at'] = renewed['claimed_at']
+        return True
+
+    @staticmethod
+    def finish(db, change: dict):
+        """Drop a finished change, or requeue it if the user was renamed again meanwhile"""
+        claim = {'_id': change['_id'], 'claimed_at': change['claimed_at']}
+        result = db.username_changes.delete_one(dict(claim, requested_at=change['requested_at']))
+        if result.deleted_count == 0:
+            db.username_changes.update_one(claim, {'$set': {'status': 'pending'}})
+
+    @staticmethod
+    def release(db, change: dict):
+        """Put a failed change back in the queue, unless another pass has taken it over"""
+        db.username_changes.update_one(
+            {'_id': change['_id'], 'claimed_at': change['claimed_at']},
+            {'$set': {'status': 'pending'}}
+        )
+
+    @staticmethod
+    def ensure_indexes(db):
+        """Create indexes for claiming changes"""
+        create_index(db.username_changes, [('status', ASCENDING), ('requested_at', ASCENDING)])
@@ -0,0 +1,204 @@
+"""
+AI gateway process shared by all web workers.
+
+Run next to the web server on the same host:
+
+    AI_GATEWAY_SOCKET=/tmp/ai_gateway.sock python -m services.ai_gateway_service
+
+Web workers started with the same AI_GATEWAY_SOCKET send their prompts here
+instead of calling the provider directly. The gateway owns a pooled provider
+client, a response cache, a shared rate limit and coalesces identical
+in-flight prompts, so these are shared no matter how many workers run.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Any
+import httpx
+from config import config
+
+AI_GATEWAY_SOCKET = os.getenv("AI_GATEWAY_SOCKET", "/tmp/ai_gateway.sock")
+AI_GATEWAY_TIMEOUT = float(os.getenv("AI_GATEWAY_TIMEOUT", 25))
+AI_GATEWAY_CACHE_TTL = int(os.getenv("AI_GATEWAY_CACHE_TTL", 300))
+AI_GATEWAY_CACHE_SIZE = int(os.getenv("AI_GATEWAY_CACHE_SIZE", 1000))
+AI_GATEWAY_RATE_PER_SECOND = float(os.getenv("AI_GATEWAY_RATE_PER_SECOND", 2))
+AI_GATEWAY_BURST = int(os.getenv("AI_GATEWAY_BURST", 10))
+AI_GATEWAY_MAX_CONCURRENCY = int(os.getenv("AI_GATEWAY_MAX_CONCURRENCY", 8))
+
+# Requests and responses are single JSON lines
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+class AIGatewayError(Exception):
+    pass
+
+
+async def _close_writer(writer: asyncio.StreamWriter):
+    # Wait for the transport to close so sockets are not left for the garbage collector
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        # The peer may already be gone; there is nothing left to do with this connection
+        pass
+
+
+class AIGatewayClient:
+    """Thin client used by web workers to reach the gateway"""
+
+    @staticmethod
+    async def generate_json(prompt: str) -> Dict[str, Any]:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(AI_GATEWAY_SOCKET, limit=MAX_MESSAGE_BYTES),
+            timeout=AI_GATEWAY_TIMEOUT
+        )
+        try:
+            writer.write(json.dumps({"op": "generate_json", "prompt": prompt}).encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=AI_GATEWAY_TIMEOUT)
+        finally:
+            await _close_writer(writer)
+
+        if not line:
+            raise AIGatewayError("AI gateway closed the connection")
+
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise AIGatewayError(response.get("error", "AI gateway request failed"))
+        return response["result"]
+
+
+class AIGatewayServer:
+    """Unix socket server that owns provider access for every worker"""
+
+    def __init__(self, socket_path: str = AI_GATEWAY_SOCKET):
+        self.socket_path = socket_path
+        self._client = None
+        self._cache = {}
+        self._in_flight = {}
+        self._tokens = float(AI_GATEWAY_BURST)
+        self._tokens_updated = time.monotonic()
+        self._semaphore = None
+
+    async def serve_forever(self):
+        self._client = httpx.AsyncClient(
+            timeout=20.0,
+            limits=httpx.Limits(max_connections=AI_GATEWAY_MAX_CONCURRENCY, max_keepalive_connections=AI_GATEWAY_MAX_CONCURRENCY)
+        )
+        self._semaphore = asyncio.Semaphore(AI_GATEWAY_MAX_CONCURRENCY)
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path, limit=MAX_MESSAGE_BYTES)
+        os.chmod(self.socket_path, 0o660)
+        logging.info(f"AI gateway listening on {self.socket_path}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self._client.aclose()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+
+            request = json.loads(line)
+            if request.get("op") != "generate_json" or not isinstance(request.get("prompt"), str):
+                response = {"ok": False, "error": "Unsupported request"}
+            else:
+                try:
+                    result = await self.generate_json(request["prompt"])
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        except Exception as e:
+            logging.error(f"AI gateway connection error: {e}")
+        finally:
+            await _close_writer(writer)
+
+    async def generate_json(self, prompt: str) -> Dict[str, Any]:
+        """Serve a prompt from cache, an identical in-flight call, or the provider"""
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Coalesce identical prompts onto a single provider call
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        if not self._take_token():
+            raise AIGatewayError("Rate limited by AI gateway")
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._call_provider(prompt)
+            self._store(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other request was waiting
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+            if not future.done():
+                # Cancelled (a BaseException): fail the coalesced waiters instead of leaving them hanging
+                future.set_exception(AIGatewayError("AI request was cancelled"))
+                future.exception()
+
+    async def _call_provider(self, prompt: str) -> Dict[str, Any]:
+        from services.mood_ai_service import MoodAIService
+
+        async with self._semaphore:
+            return await MoodAIService._generate_json(prompt, self._client)
+
+    def _take_token(self) -> bool:
+        # Token bucket shared by every worker that talks to this gateway
+        now = time.monotonic()
+        self._tokens = min(AI_GATEWAY_BURST, self._tokens + (now - self._tokens_updated) * AI_GATEWAY_RATE_PER_SECOND)
+        self._tokens_updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _store(self, key: str, result: Dict[str, Any]):
+        if AI_GATEWAY_CACHE_TTL <= 0:
+            return
+
+        now = time.monotonic()
+        if len(self._cache) >= AI_GATEWAY_CACHE_SIZE:
+            for expired_key in [k for k, (expires_at, _) in self._cache.items() if expires_at <= now]:
+                del self._cache[expired_key]
+            while len(self._cache) >= AI_GATEWAY_CACHE_SIZE:
+                # Dicts keep insertion order, so this evicts the oldest entry
+                del self._cache[next(iter(self._cache))]
+
+        self._cache[key] = (now + AI_GATEWAY_CACHE_TTL, result)
+
+
+def main():
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
+    asyncio.run(AIGatewayServer().serve_forever())
+
+
+if __name__ == "__main__":
+    main()
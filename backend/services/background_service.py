@@ -0,0 +1,68 @@
+import os
+import threading
+from typing import Callable
+
+
+class PerProcess:
+    """Lazily builds one object per worker process
+
+    Threads and pools do not survive a fork, so the object is rebuilt the
+    first time it is used in each gunicorn worker.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None or self._pid != os.getpid():
+            with self._lock:
+                if self._value is None or self._pid != os.getpid():
+                    self._value = self._factory()
+                    self._pid = os.getpid()
+        return self._value
+
+
+class BackgroundThread:
+    """A daemon thread started on demand, once per worker process
+
+    The thread is started again when it has died or when it belongs to the
+    parent of a forked worker.
+    """
+
+    def __init__(self, target: Callable, name: str):
+        self._target = target
+        self._name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._target, name=self._name, daemon=True)
+            self._thread.start()
+
+
+class PeriodicWorker(BackgroundThread):
+    """Runs `task` every `interval` seconds in a background thread, or sooner when woken"""
+
+    def __init__(self, task: Callable, interval: float, name: str):
+        super().__init__(self._run, name)
+        self._task = task
+        self.interval = interval
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._task()
+
@@ -0,0 +1,146 @@
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, Optional
+from config import config
+from services.background_service import BackgroundThread
+
+
+class Subscription:
+    """Messages published to one channel, read by a single stream"""
+
+    def __init__(self, broker, channel: str, max_pending: int = 100):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def put(self, message: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # A stalled client must not block publishers; it catches up on reconnect
+            logging.warning(f"Dropping message for slow subscriber on {self.channel}")
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to `timeout` seconds for the next message"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub, only reaches subscribers connected to this worker"""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.deliver(channel, message)
+
+    def deliver(self, channel: str, message: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+class RedisBroker(LocalBroker):
+    """Pub/sub across workers through Redis
+
+    Publishes go to Redis; one listener thread per worker receives every chat
+    and job channel and hands messages to the local subscribers.
+    """
+
+    def __init__(self, redis_url: str, patterns=('chat:*', 'job:*')):
+        super().__init__()
+        import redis
+        self._redis = redis.Redis.from_url(redis_url)
+        self._patterns = patterns
+        self._listener = BackgroundThread(self._listen, "chat-redis-listener")
+
+    def subscribe(self, channel: str) -> Subscription:
+        self._listener.ensure_started()
+        return super().subscribe(channel)
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self._redis.publish(channel, json.dumps(message))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(*self._patterns)
+                for item in pubsub.listen():
+                    channel = item['channel'].decode('utf-8')
+                    self.deliver(channel, json.loads(item['data']))
+            except Exception as e:
+                logging.error(f"Chat Redis listener error, reconnecting: {e}")
+                time.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+# Long-poll requests parked in this worker; beyond this they answer immediately
+_wait_slots = threading.BoundedSemaphore(config.CHAT_LONG_POLL_MAX_WAITERS)
+
+# Open streams in this worker, each holding a server thread; beyond this new streams are refused
+_stream_slots = threading.BoundedSemaphore(config.CHAT_STREAM_MAX_STREAMS)
+
+
+def get_broker():
+    """Redis-backed broker when REDIS_URL is set, otherwise in-process"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = RedisBroker(config.REDIS_URL) if config.REDIS_URL else LocalBroker()
+    return _broker
+
+
+def conversation_channel(conversation_id: str) -> str:
+    return f"chat:{conversation_id}"
+
+
+def acquire_stream_slot() -> bool:
+    """Reserve one of this worker's CHAT_STREAM_MAX_STREAMS stream slots without waiting"""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot():
+    _stream_slots.release()
+
+
+def wait_for_message(subscription: Subscription, timeout: float) -> bool:
+    """Park until a message arrives on the subscription or the timeout passes
+
+    Returns False straight away when this worker already has
+    CHAT_LONG_POLL_MAX_WAITERS requests waiting.
+    """
+    if not _wait_slots.acquire(blocking=False):
+        return False
+    try:
+        return subscription.get(min(timeout, config.CHAT_LONG_POLL_MAX_WAIT)) is not None
+    finally:
+        _wait_slots.release()
@@ -0,0 +1,84 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from config import config
+from models.database import get_background_db
+from services.background_service import PeriodicWorker
+
+
+class CounterBuffer:
+    """Per-worker accumulator for counter increments on hot documents.
+
+    Increments for the same document are summed in memory and written with a
+    single bulk_write every flush interval, so a burst of likes on one post
+    becomes one $inc instead of one write per click. Pending increments are
+    flushed when the worker process exits.
+    """
+
+    def __init__(self, collection_name: str, flush_interval: float = 2.0, max_documents: int = 5000):
+        self.collection_name = collection_name
+        self.flush_interval = flush_interval
+        self.max_documents = max_documents
+        self._deltas = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = PeriodicWorker(self.flush, flush_interval, f"{collection_name}-counter-flusher")
+        atexit.register(self.flush)
+
+    def add(self, doc_id: str, **deltas):
+        """Queue increments for a document"""
+        with self._lock:
+            pending = self._deltas[str(doc_id)]
+            for field, delta in deltas.items():
+                pending[field] += delta
+            documents = len(self._deltas)
+        self._worker.ensure_started()
+
+        if documents >= self.max_documents:
+            self._worker.wake()
+
+    def flush(self) -> int:
+        """Write pending increments, returns the number of documents updated"""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, defaultdict(lambda: defaultdict(int))
+
+            now = datetime.utcnow()
+            operations = []
+            for doc_id, fields in deltas.items():
+                increments = {field: delta for field, delta in fields.items() if delta}
+                if increments:
+                    operations.append(UpdateOne(
+                        {'_id': ObjectId(doc_id)},
+                        {'$inc': increments, '$set': {'counters_updated_at': now}}
+                    ))
+
+            if not operations:
+                return 0
+
+            try:
+                get_background_db()[self.collection_name].bulk_write(operations, ordered=False)
+                return len(operations)
+            except Exception as e:
+                logging.error(f"Error flushing counters for {len(operations)} {self.collection_name} documents: {e}")
+                self._merge_back(deltas)
+                return 0
+
+    def _merge_back(self, deltas):
+        # Keep failed increments for the next flush rather than losing them
+        with self._lock:
+            for doc_id, fields in deltas.items():
+                pending = self._deltas[doc_id]
+                for field, delta in fields.items():
+                    pending[field] += delta
+
+
+post_counter_buffer = CounterBuffer(
+    'community_posts',
+    flush_interval=config.COUNTER_FLUSH_SECONDS,
+    max_documents=config.COUNTER_BUFFER_MAX_DOCUMENTS
+)
@@ -0,0 +1,104 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List
+from config import config
+from models.database import get_background_db
+from services.background_service import PeriodicWorker
+
+
+class EventBuffer:
+    """In-process buffer that writes append-only events with insert_many.
+
+    Events are flushed when the batch size is reached or the flush interval
+    elapses, whichever comes first. Memory is bounded by max_pending: when the
+    buffer is full the oldest events are dropped, and the number dropped is
+    logged from flush at most once per drop_log_interval. Pending events are
+    flushed when the worker process exits.
+    """
+
+    drop_log_interval = 60.0
+
+    def __init__(self, collection_name: str, batch_size: int = 100, flush_interval: float = 5.0, max_pending: int = 10000):
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._events = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = PeriodicWorker(self.flush, flush_interval, f"{collection_name}-flusher")
+        self.dropped = 0
+        self._dropped_logged = 0
+        self._drop_logged_at = None
+        atexit.register(self.flush)
+
+    def add(self, event: Dict[str, Any]):
+        """Queue an event without touching the database"""
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            pending = len(self._events)
+        self._worker.ensure_started()
+
+        if pending >= self.batch_size:
+            self._worker.wake()
+
+    def flush(self) -> int:
+        """Write all pending events, returns the number written"""
+        with self._flush_lock:
+            self._log_dropped()
+            written = 0
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return written
+
+                try:
+                    get_background_db()[self.collection_name].insert_many(batch, ordered=False)
+                    written += len(batch)
+                except Exception as e:
+                    logging.error(f"Error flushing {len(batch)} events to {self.collection_name}: {e}")
+                    self._requeue(batch)
+                    return written
+
+    def _log_dropped(self):
+        now = time.monotonic()
+        if self._drop_logged_at is not None and now - self._drop_logged_at < self.drop_log_interval:
+            return
+        with self._lock:
+            dropped = self.dropped - self._dropped_logged
+            self._dropped_logged = self.dropped
+        if dropped:
+            self._drop_logged_at = now
+            logging.warning(f"Dropped {dropped} events for {self.collection_name} because the buffer was full")
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            batch = []
+            while self._events and len(batch) < self.batch_size:
+                batch.append(self._events.popleft())
+            return batch
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        # Put a failed batch back in front, keeping whatever still fits
+        with self._lock:
+            room = self._events.maxlen - len(self._events)
+            kept = batch[-room:] if room > 0 else []
+            self.dropped += len(batch) - len(kept)
+            self._events.extendleft(reversed(kept))
+
+
+def _configured_buffer(collection_name: str) -> EventBuffer:
+    return EventBuffer(
+        collection_name,
+        batch_size=config.EVENT_BUFFER_BATCH_SIZE,
+        flush_interval=config.EVENT_BUFFER_FLUSH_SECONDS,
+        max_pending=config.EVENT_BUFFER_MAX_PENDING
+    )
+
+
+ai_feedback_buffer = _configured_buffer('ai_feedback')
+impression_buffer = _configured_buffer('recommendation_impressions')
@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config import config
+from models.community_posts import CommunityPost
+
+
+class FeedCacheService:
+    """Per-worker cache of the serialized first page of the feed for each filter
+
+    Entries hold the newest FEED_CACHE_SIZE public posts for a (mood,
+    activity_type) filter. Creating a post drops the entries it would appear
+    in; the short TTL absorbs counter drift and writes made by other workers.
+    """
+
+    _entries = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_first_page(limit: int, mood_filter: str = None, activity_type_filter: str = None) -> Tuple[List[Dict[str, Any]], List[tuple]]:
+        """Get the first `limit` serialized posts and their (created_at, _id) keys"""
+        key = (mood_filter.lower() if mood_filter else None, activity_type_filter)
+        entry = FeedCacheService._get_entry(key)
+
+        if entry is None:
+            posts = CommunityPost.get_posts(
+                limit=config.FEED_CACHE_SIZE,
+                mood_filter=mood_filter,
+                activity_type_filter=activity_type_filter
+            )
+            keys = [(post['created_at'], post['_id']) for post in posts]
+            entry = {
+                'expires_at': time.monotonic() + config.FEED_CACHE_TTL,
+                'keys': keys,
+                'posts': [FeedCacheService._serialize(post) for post in posts]
+            }
+            with FeedCacheService._lock:
+                FeedCacheService._entries[key] = entry
+
+        # Copy so per-user flags added by the caller never leak into the cache
+        return [dict(post) for post in entry['posts'][:limit]], entry['keys'][:limit]
+
+    @staticmethod
+    def invalidate(mood: str = None, activity_type: str = None):
+        """Drop every cached page a new post with this mood and activity type belongs to"""
+        mood = mood.lower() if mood else None
+        keys = {(None, None), (mood, None), (None, activity_type), (mood, activity_type)}
+        with FeedCacheService._lock:
+            for key in keys:
+                FeedCacheService._entries.pop(key, None)
+
+    @staticmethod
+    def _get_entry(key: tuple) -> Optional[Dict[str, Any]]:
+        with FeedCacheService._lock:
+            entry = FeedCacheService._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.monotonic():
+                del FeedCacheService._entries[key]
+                return None
+            return entry
+
+    @staticmethod
+    def _serialize(post: Dict[str, Any]) -> Dict[str, Any]:
+        post['_id'] = str(post['_id'])
+        post['user_id'] = str(post['user_id'])
+        post['created_at'] = post['created_at'].isoformat()
+        return post
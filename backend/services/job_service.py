@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from config import config
+from models.ai_jobs import AIJob
+from models.database import get_background_db
+from services.background_service import PerProcess, PeriodicWorker
+from services.chat_pubsub_service import get_broker
+from services.mood_ai_service import MoodAIService
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+def job_channel(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+class JobService:
+    """Runs slow AI analysis on a worker pool so requests can return immediately"""
+
+    _executor = PerProcess(lambda: ThreadPoolExecutor(max_workers=config.AI_JOB_WORKERS, thread_name_prefix='ai-job'))
+    _lock = threading.Lock()
+    _pending = 0
+    _events = {}  # job_id -> threading.Event, for jobs submitted by this worker
+    # One heartbeat thread per worker process keeps this worker's queued and running jobs fresh
+    _heartbeat = PeriodicWorker(lambda: JobService._send_heartbeat(), config.AI_JOB_HEARTBEAT_SECONDS, 'ai-job-heartbeat')
+    # Long-poll requests parked in this worker, each holding a server thread
+    _wait_slots = threading.BoundedSemaphore(config.AI_JOB_MAX_WAITERS)
+
+    @staticmethod
+    def submit_counseling(user_id: str, entry_text: str, mood: str = None) -> str:
+        """Queue sentiment analysis and counseling, returns the job id"""
+        with JobService._lock:
+            if JobService._pending >= config.AI_JOB_MAX_PENDING:
+                raise JobQueueFullError("Too many pending analysis jobs")
+            JobService._pending += 1
+
+        try:
+            job_id = AIJob.create(user_id, 'counseling', config.AI_JOB_RESULT_TTL)
+            JobService._events[job_id] = threading.Event()
+            # The entry text is only passed to the worker, never stored with the job
+            JobService._executor.get().submit(JobService._run_counseling, job_id, entry_text, mood)
+            JobService._heartbeat.ensure_started()
+        except Exception:
+            with JobService._lock:
+                JobService._pending -= 1
+            raise
+
+        return job_id
+
+    @staticmethod
+    def get_job(job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job, failing it first if the worker running it has died"""
+        job = AIJob.get_for_user(job_id, user_id)
+        if job and AIJob.is_stale(job, config.AI_JOB_STALE_SECONDS):
+            AIJob.fail_stale(job_id, config.AI_JOB_STALE_SECONDS)
+            job = AIJob.get_for_user(job_id, user_id)
+        return job
+
+    @staticmethod
+    def wait_for_job(job_id: str, user_id: str, wait: float) -> Optional[Dict[str, Any]]:
+        """Return the job, waiting up to `wait` seconds for it to finish
+
+        Returns straight away when this worker already has AI_JOB_MAX_WAITERS
+        requests waiting. A job submitted by another worker wakes the waiter
+        through the broker when REDIS_URL is set; the store is also re-checked
+        with a backoff up to AI_JOB_MAX_POLL_SECONDS.
+        """
+        if not JobService._wait_slots.acquire(blocking=False):
+            return JobService.get_job(job_id, user_id)
+
+        subscription = None
+        try:
+            deadline = time.monotonic() + min(wait, config.AI_JOB_MAX_WAIT)
+            interval = 0.5
+            while True:
+                job = JobService.get_job(job_id, user_id)
+                remaining = deadline - time.monotonic()
+                if not job or job['status'] != 'pending' or remaining <= 0:
+                    return job
+
+                event = JobService._events.get(job_id)
+                if event is not None:
+                    event.wait(remaining)
+                elif subscription is None:
+                    # Re-check once subscribed so a completion published in between is not missed
+                    subscription = get_broker().subscribe(job_channel(job_id))
+                else:
+                    subscription.get(min(interval, remaining))
+                    interval = min(interval * 2, config.AI_JOB_MAX_POLL_SECONDS)
+        finally:
+            if subscription is not None:
+                subscription.close()
+            JobService._wait_slots.release()
+
+    @staticmethod
+    def _send_heartbeat():
+        job_ids = list(JobService._events)
+        if not job_ids:
+            return
+        try:
+            AIJob.heartbeat(get_background_db(), job_ids)
+        except Exception as e:
+            logging.error(f"Error sending heartbeat for {len(job_ids)} AI jobs: {e}")
+
+    @staticmethod
+    def _run_counseling(job_id: str, entry_text: str, mood: str = None):
+        try:
+            analysis = asyncio.run(
+                MoodAIService.analyze_sentiment_and_counseling(entry_text, mood)
+            )
+            AIJob.complete(get_background_db(), job_id, result=analysis)
+        except Exception as e:
+            logging.error(f"Error running counseling job {job_id}: {e}")
+            try:
+                AIJob.complete(get_background_db(), job_id, error="Analysis failed")
+            except Exception as store_error:
+                logging.error(f"Error storing failed job {job_id}: {store_error}")
+        finally:
+            with JobService._lock:
+                JobService._pending -= 1
+            event = JobService._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+            try:
+                # Waiters parked in other workers
+                get_broker().publish(job_channel(job_id), {'job_id': job_id})
+            except Exception as e:
+                logging.error(f"Error publishing completion of job {job_id}: {e}")
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import httpx
 import json
 import logging
@@ -10,6 +11,11 @@ from services.resource_service import ResourceService
 API_PROVIDER = os.getenv("AI_PROVIDER", "openai").lower()
 API_KEY = os.getenv("API_KEY")
 MODEL_NAME = os.getenv("AI_MODEL_NAME", "gpt-4o-mini")
+AI_ALTERNATIVES_COUNT = int(os.getenv("AI_ALTERNATIVES_COUNT", 5))
+AI_FANOUT_ALTERNATIVES = os.getenv("AI_FANOUT_ALTERNATIVES", "false").lower() == "true"
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 3))
+AI_GATEWAY_SOCKET = os.getenv("AI_GATEWAY_SOCKET")
+AI_RECOMMENDATION_TYPES = ["movie", "cocktail", "activity", "music"]
 
 class MoodAIService:
     _recommendation_cache = {}
@@ -172,12 +178,13 @@ class MoodAIService:
         Generate personalized recommendations based on mood, user profile, and what happened
         """
         # Always try to get fresh AI recommendations first
-        if API_KEY:
+        if API_KEY or AI_GATEWAY_SOCKET:
             current_time = time.time()
             time_since_last_call = current_time - MoodAIService._last_api_call
             logging.info(f"Time since last API call: {time_since_last_call}s, cooldown: {MoodAIService._api_cooldown}s")
             
-            if time_since_last_call >= MoodAIService._api_cooldown:
+            # The AI gateway applies one shared rate limit for all workers
+            if AI_GATEWAY_SOCKET or time_since_last_call >= MoodAIService._api_cooldown:
                 try:
                     logging.info(f"Attempting fresh AI recommendation for mood: {mood}")
                     recommendation = await MoodAIService._generate_ai_recommendation(mood, user_profile, description, activity_type)
@@ -197,8 +204,66 @@ class MoodAIService:
     
     @staticmethod
     async def _generate_ai_recommendation(mood: str, user_profile: Dict[str, Any], description: str = None, activity_type: str = None) -> Dict[str, Any]:
-        """Generate recommendation using AI service"""
+        """Generate a primary recommendation plus alternatives using AI service"""
         
+        age = user_profile.get('age', 25)
+        
+        try:
+            if not AI_FANOUT_ALTERNATIVES:
+                # One structured call returns the primary item and its alternatives together
+                prompt = MoodAIService._build_recommendation_prompt(
+                    mood, user_profile, description, activity_type, AI_ALTERNATIVES_COUNT
+                )
+                return MoodAIService._normalize_ai_recommendation(
+                    await MoodAIService._generate_json(prompt), activity_type
+                )
+
+            # Fan out: primary item and one prompt per alternative type, run concurrently
+            semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+            alternative_types = [t for t in AI_RECOMMENDATION_TYPES if t != activity_type]
+            if age and age < 18:
+                alternative_types = ["mocktail" if t == "cocktail" else t for t in alternative_types]
+            # Split the count exactly: the first types take the remainder, types with no share are not asked
+            base, extra = divmod(AI_ALTERNATIVES_COUNT, len(alternative_types))
+            shares = [(alt_type, base + (1 if i < extra else 0)) for i, alt_type in enumerate(alternative_types)]
+            shares = [(alt_type, share) for alt_type, share in shares if share > 0]
+
+            async def generate(prompt: str, required: bool):
+                async with semaphore:
+                    try:
+                        return await MoodAIService._generate_json(prompt)
+                    except Exception as e:
+                        if required:
+                            raise
+                        logging.warning(f"AI alternative generation failed: {e}")
+                        return {}
+
+            primary_prompt = MoodAIService._build_recommendation_prompt(mood, user_profile, description, activity_type, 0)
+            results = await asyncio.gather(
+                generate(primary_prompt, True),
+                *(
+                    generate(MoodAIService._build_alternatives_prompt(mood, user_profile, description, alt_type, share), False)
+                    for alt_type, share in shares
+                )
+            )
+
+            alternatives = []
+            for result, (_, share) in zip(results[1:], shares):
+                if isinstance(result, dict) and isinstance(result.get("alternatives"), list):
+                    # A provider that returns more than asked must not crowd out the later types
+                    alternatives.extend(result["alternatives"][:share])
+
+            return MoodAIService._normalize_ai_recommendation(
+                {"recommendation": (results[0] or {}).get("recommendation"), "alternatives": alternatives},
+                activity_type
+            )
+        except Exception as e:
+            logging.error(f"AI service error: {e}")
+            raise
+
+    @staticmethod
+    def _profile_prompt_section(user_profile: Dict[str, Any], description: str = None) -> str:
+        """Describe the user and what happened for recommendation prompts"""
         age = user_profile.get('age', 25)
         gender = user_profile.get('gender', 'unknown')
         nationality = user_profile.get('nationality', 'unknown')
@@ -214,13 +279,23 @@ class MoodAIService:
         if age and age < 18:
             age_restriction_note = f"\nIMPORTANT: User is {age} years old (under 18). DO NOT recommend alcoholic beverages. Instead, suggest non-alcoholic alternatives like mocktails, smoothies, or hot drinks."
         
-        prompt = f"""You are a mood-based recommendation AI. Generate a personalized recommendation for a user who is feeling {mood}.{context}
+        return f"""{context}
 
 User Profile:
 - Age: {age}
 - Gender: {gender}
 - Nationality: {nationality}
-- Hobbies: {', '.join(hobbies) if hobbies else 'Not specified'}{age_restriction_note}
+- Hobbies: {', '.join(hobbies) if hobbies else 'Not specified'}{age_restriction_note}"""
+
+    @staticmethod
+    def _build_recommendation_prompt(mood: str, user_profile: Dict[str, Any], description: str = None, activity_type: str = None, alternatives_count: int = 5) -> str:
+        """Prompt for a primary recommendation with an optional list of alternatives"""
+        if alternatives_count:
+            alternatives_instruction = f"Provide {alternatives_count} alternatives, preferring types other than the main recommendation."
+        else:
+            alternatives_instruction = "Return an empty alternatives list."
+
+        return f"""You are a mood-based recommendation AI. Generate a personalized recommendation for a user who is feeling {mood}.{MoodAIService._profile_prompt_section(user_profile, description)}
 
 Activity Type: {activity_type or 'any'}
 
@@ -243,87 +318,139 @@ Generate a JSON response with:
     ]
 }}
 
-Provide 5 alternatives. Make it personal and contextual. Consider what happened to them, their age, interests, and cultural background. Be encouraging and supportive. If they're going through something difficult, offer comfort and hope.
+{alternatives_instruction} Make it personal and contextual. Consider what happened to them, their age, interests, and cultural background. Be encouraging and supportive. If they're going through something difficult, offer comfort and hope.
 """
-        
-        try:
-            if API_PROVIDER == "gemini":
-                return await MoodAIService._generate_gemini_json(prompt)
 
-            return await MoodAIService._generate_openai_json(prompt)
-        except Exception as e:
-            logging.error(f"AI service error: {e}")
-            raise
+    @staticmethod
+    def _build_alternatives_prompt(mood: str, user_profile: Dict[str, Any], description: str, rec_type: str, count: int) -> str:
+        """Prompt for alternatives of a single type, used when fanning out"""
+        return f"""You are a mood-based recommendation AI. Suggest {count} {rec_type} options for a user who is feeling {mood}.{MoodAIService._profile_prompt_section(user_profile, description)}
+
+Generate a JSON response with:
+{{
+    "alternatives": [
+        {{
+            "type": "{rec_type}",
+            "title": "Specific {rec_type} title",
+            "description": "Brief description of why it fits their mood"
+        }}
+    ]
+}}
+"""
 
     @staticmethod
-    async def _generate_openai_json(prompt: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": MODEL_NAME,
-                    "messages": [
-                        {"role": "system", "content": "Return valid JSON only."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "response_format": {"type": "json_object"},
-                    "max_completion_tokens": 1000
-                }
-            )
+    def _normalize_ai_recommendation(data: Dict[str, Any], activity_type: str = None) -> Dict[str, Any]:
+        """Validate the AI response shape and clean up its alternatives"""
+        recommendation = data.get("recommendation") if isinstance(data, dict) else None
+        if not isinstance(recommendation, dict) or not recommendation.get("title"):
+            raise ValueError("AI response did not include a recommendation")
+
+        recommendation["type"] = recommendation.get("type") or activity_type or "activity"
+        recommendation["description"] = recommendation.get("description") or ""
 
-            if response.status_code == 429:
-                MoodAIService._api_cooldown = min(60, MoodAIService._api_cooldown * 2)
-                logging.warning(f"Rate limited by AI service. Increasing cooldown to {MoodAIService._api_cooldown}s")
-                raise Exception("Rate limited by AI service")
+        alternatives = []
+        seen_titles = {recommendation["title"].strip().lower()}
+        for alternative in data.get("alternatives") or []:
+            if not isinstance(alternative, dict) or not alternative.get("title"):
+                continue
+            title_key = alternative["title"].strip().lower()
+            if title_key in seen_titles:
+                continue
+            seen_titles.add(title_key)
+            alternatives.append({
+                "type": alternative.get("type") or recommendation["type"],
+                "title": alternative["title"],
+                "description": alternative.get("description", "")
+            })
+
+        return {
+            "recommendation": recommendation,
+            "alternatives": alternatives[:AI_ALTERNATIVES_COUNT]
+        }
+
+    @staticmethod
+    async def _generate_json(prompt: str, client: httpx.AsyncClient = None) -> Dict[str, Any]:
+        """Send a JSON prompt to the configured provider, or to the AI gateway when enabled"""
+        if client is None:
+            if AI_GATEWAY_SOCKET:
+                from services.ai_gateway_service import AIGatewayClient
+                return await AIGatewayClient.generate_json(prompt)
 
-            if response.status_code >= 400:
-                logging.error(f"OpenAI error {response.status_code}: {response.text}")
-                response.raise_for_status()
+            async with httpx.AsyncClient(timeout=20.0) as client:
+                return await MoodAIService._generate_json(prompt, client)
 
+        if API_PROVIDER == "gemini":
+            return await MoodAIService._generate_gemini_json(prompt, client)
+
+        return await MoodAIService._generate_openai_json(prompt, client)
+
+    @staticmethod
+    async def _generate_openai_json(prompt: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+        response = await client.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {API_KEY}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "model": MODEL_NAME,
+                "messages": [
+                    {"role": "system", "content": "Return valid JSON only."},
+                    {"role": "user", "content": prompt}
+                ],
+                "response_format": {"type": "json_object"},
+                "max_completion_tokens": 1000
+            }
+        )
+
+        if response.status_code == 429:
+            MoodAIService._api_cooldown = min(60, MoodAIService._api_cooldown * 2)
+            logging.warning(f"Rate limited by AI service. Increasing cooldown to {MoodAIService._api_cooldown}s")
+            raise Exception("Rate limited by AI service")
+
+        if response.status_code >= 400:
+            logging.error(f"OpenAI error {response.status_code}: {response.text}")
             response.raise_for_status()
-            response_data = response.json()
-            MoodAIService._api_cooldown = 3
-            ai_response_content = response_data["choices"][0]["message"]["content"]
-            return json.loads(ai_response_content)
+
+        response.raise_for_status()
+        response_data = response.json()
+        MoodAIService._api_cooldown = 3
+        ai_response_content = response_data["choices"][0]["message"]["content"]
+        return json.loads(ai_response_content)
 
     @staticmethod
-    async def _generate_gemini_json(prompt: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(
-                f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={API_KEY}",
-                headers={
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "contents": [
-                        {"role": "user", "parts": [{"text": prompt}]}
-                    ],
-                    "generationConfig": {
-                        "temperature": 0.8,
-                        "maxOutputTokens": 1000
-                    }
+    async def _generate_gemini_json(prompt: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+        response = await client.post(
+            f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent?key={API_KEY}",
+            headers={
+                "Content-Type": "application/json"
+            },
+            json={
+                "contents": [
+                    {"role": "user", "parts": [{"text": prompt}]}
+                ],
+                "generationConfig": {
+                    "temperature": 0.8,
+                    "maxOutputTokens": 1000
                 }
-            )
+            }
+        )
 
-            if response.status_code == 429:
-                MoodAIService._api_cooldown = min(60, MoodAIService._api_cooldown * 2)
-                logging.warning(f"Rate limited by AI service. Increasing cooldown to {MoodAIService._api_cooldown}s")
-                raise Exception("Rate limited by AI service")
+        if response.status_code == 429:
+            MoodAIService._api_cooldown = min(60, MoodAIService._api_cooldown * 2)
+            logging.warning(f"Rate limited by AI service. Increasing cooldown to {MoodAIService._api_cooldown}s")
+            raise Exception("Rate limited by AI service")
 
-            response.raise_for_status()
-            response_data = response.json()
-            MoodAIService._api_cooldown = 3
-            ai_response_content = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            return json.loads(ai_response_content)
+        response.raise_for_status()
+        response_data = response.json()
+        MoodAIService._api_cooldown = 3
+        ai_response_content = response_data["candidates"][0]["content"]["parts"][0]["text"]
+        return json.loads(ai_response_content)
 
     @staticmethod
     async def analyze_sentiment_and_counseling(entry_text: str, mood: str = None) -> Dict[str, Any]:
         """Provide sentiment analysis and supportive guidance."""
-        if not API_KEY:
+        if not API_KEY and not AI_GATEWAY_SOCKET:
             return {
                 "sentiment": "unknown",
                 "risk_level": "unknown",
@@ -352,10 +479,7 @@ Return JSON:
 }}
 """
 
-        if API_PROVIDER == "gemini":
-            return await MoodAIService._generate_gemini_json(prompt)
-
-        return await MoodAIService._generate_openai_json(prompt)
+        return await MoodAIService._generate_json(prompt)
     
     @staticmethod
     def _generate_local_recommendation(mood: str, user_profile: Dict[str, Any], description: str = None, activity_type: str = None) -> Dict[str, Any]:
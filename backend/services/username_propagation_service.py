@@ -0,0 +1,115 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateMany
+from config import config
+from models.database import get_background_db
+from models.username_changes import UsernameChange
+from services.background_service import PerProcess
+
+
+class ClaimLostError(Exception):
+    pass
+
+
+class UsernamePropagationService:
+    """Copies a changed username into the posts, comments and conversations that snapshot it
+
+    Changes are queued in username_changes and applied by one background
+    thread per worker, in batches of USERNAME_PROPAGATION_BATCH_SIZE documents
+    with a pause between batches, so a rename of a prolific user does not
+    flood the database. Anything left behind by a restart is picked up by the
+    next rename or by `python maintenance.py propagate-usernames`.
+    """
+
+    # One thread per worker process keeps the writes serial
+    _executor = PerProcess(lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix='username-propagation'))
+
+    @staticmethod
+    def request(db, user_id: str, username: str):
+        """Queue propagation of a new username and wake the worker"""
+        UsernameChange.request(db, user_id, username)
+        UsernamePropagationService._executor.get().submit(UsernamePropagationService._drain)
+
+    @staticmethod
+    def run_pending(db) -> int:
+        """Apply every queued change in this thread, returns the number of documents updated"""
+        updated = 0
+        while True:
+            change = UsernameChange.claim(db)
+            if not change:
+                return updated
+            updated += UsernamePropagationService._apply(db, change)
+
+    @staticmethod
+    def _drain():
+        try:
+            UsernamePropagationService.run_pending(get_background_db())
+        except Exception as e:
+            logging.error(f"Error draining username changes: {e}")
+
+    @staticmethod
+    def _apply(db, change: dict) -> int:
+        user_id = change['_id']
+
+        def renew_claim():
+            if not UsernameChange.renew(db, change):
+                raise ClaimLostError()
+
+        updated = 0
+        try:
+            for collection, query, update in UsernamePropagationService._targets(user_id, change['username']):
+                for modified in UsernamePropagationService._update_in_batches(db[collection], query, update, renew_claim):
+                    updated += modified
+        except ClaimLostError:
+            # Another pass took over after our claim went stale; it redoes the whole change
+            logging.warning(f"Username propagation for user {user_id} was taken over by another worker")
+            return updated
+        except Exception as e:
+            logging.error(f"Error propagating username for user {user_id}: {e}")
+            UsernameChange.release(db, change)
+            return 0
+
+        UsernameChange.finish(db, change)
+        return updated
+
+    @staticmethod
+    def _targets(user_id: ObjectId, username: str):
+        participant_id = str(user_id)
+        return [
+            ('community_posts', {'user_id': user_id}, {'$set': {'user_username': username}}),
+            ('post_comments', {'user_id': user_id}, {'$set': {'user_username': username}}),
+            (
+                'chat_conversations',
+                {'participants': participant_id},
+                {'$set': {f'participant_usernames.{participant_id}': username}}
+            ),
+            (
+                'chat_conversations',
+                {'participants': participant_id, 'last_message_sender_id': user_id},
+                {'$set': {'last_message_sender_username': username}}
+            )
+        ]
+
+    @staticmethod
+    def _update_in_batches(collection, query: dict, update: dict, renew_claim):
+        # Page by _id so each batch is one bounded bulk_write, pausing in between to leave room for live traffic.
+        # Yields the documents modified per batch, so a caller stopped by a lost claim still counts earlier batches
+        last_id = None
+        while True:
+            batch_query = dict(query, _id={'$gt': last_id}) if last_id else query
+            ids = [doc['_id'] for doc in collection.find(batch_query, {'_id': 1}).sort(
+                [('_id', ASCENDING)]
+            ).limit(config.USERNAME_PROPAGATION_BATCH_SIZE)]
+            if not ids:
+                return
+
+            renew_claim()
+            result = collection.bulk_write([UpdateMany({'_id': {'$in': ids}}, update)], ordered=False)
+            yield result.modified_count
+            last_id = ids[-1]
+
+            if len(ids) < config.USERNAME_PROPAGATION_BATCH_SIZE:
+                return
+            time.sleep(config.USERNAME_PROPAGATION_PAUSE_SECONDS)
@@ -6,9 +6,244 @@ Tests the essential features without database dependencies
 import sys
 import os
 from datetime import datetime, date
+from contextlib import contextmanager
+from copy import deepcopy
+from unittest.mock import patch
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+class RecordingCollection:
+    """Stands in for a pymongo collection, recording writes instead of sending them"""
+    
+    def __init__(self):
+        self.batches = []  # documents of each insert_many
+        self.writes = []  # {_id: $inc} of each bulk_write
+        self.fail = False
+    
+    def insert_many(self, documents, ordered=True):
+        if self.fail:
+            raise RuntimeError("write failed")
+        self.batches.append(list(documents))
+    
+    def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise RuntimeError("write failed")
+        self.writes.append({operation._filter['_id']: operation._doc['$inc'] for operation in operations})
+
+def background_db(module, **collections):
+    """Point a service module's get_background_db at the given collections"""
+    return patch.object(module, 'get_background_db', lambda: collections)
+
+def _field_values(document, path):
+    """Values at a dotted path, looking into arrays the way MongoDB queries do"""
+    values = [document]
+    for part in path.split('.'):
+        found = []
+        for value in values:
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                if isinstance(item, dict) and part in item:
+                    found.append(item[part])
+        values = found
+    return [item for value in values for item in (value if isinstance(value, list) else [value])] or [None]
+
+def _compare(op, value, target):
+    try:
+        if op == '$gt':
+            return value is not None and value > target
+        if op == '$gte':
+            return value is not None and value >= target
+        if op == '$lt':
+            return value is not None and value < target
+        if op == '$lte':
+            return value is not None and value <= target
+    except TypeError:
+        return False
+    raise NotImplementedError(op)
+
+def _matches(document, query):
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif key == '$and':
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            values = _field_values(document, key)
+            for op, target in condition.items():
+                if op == '$ne':
+                    ok = target not in values
+                elif op == '$in':
+                    ok = any(value in target for value in values)
+                elif op == '$exists':
+                    ok = (values != [None]) == target
+                elif op == '$elemMatch':
+                    ok = any(isinstance(value, dict) and _matches(value, target) for value in values)
+                else:
+                    ok = any(_compare(op, value, target) for value in values)
+                if not ok:
+                    return False
+        elif condition not in _field_values(document, key):
+            return False
+    return True
+
+def _set_path(document, path, value):
+    *parents, last = path.split('.')
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+def _get_path(document, path):
+    for part in path.split('.'):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+class FakeCursor:
+    def __init__(self, documents):
+        self._documents = documents
+    
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, str) else key
+        # MongoDB orders null before any value
+        for field, order in reversed(keys):
+            self._documents.sort(
+                key=lambda document: (_get_path(document, field) is not None, _get_path(document, field)),
+                reverse=order < 0
+            )
+        return self
+    
+    def limit(self, count):
+        self._documents = self._documents[:count]
+        return self
+    
+    def batch_size(self, size):
+        return self
+    
+    def __iter__(self):
+        return iter(self._documents)
+
+class FakeCollection:
+    """In-memory stand-in for the subset of a pymongo collection the chat models use"""
+    
+    def __init__(self, unique=None):
+        self.documents = []
+        self.unique = unique  # fields that together must be unique when client_id is set
+    
+    def _check_unique(self, document):
+        if self.unique and isinstance(document.get('client_id'), str):
+            key = {field: document.get(field) for field in self.unique}
+            if any(_matches(existing, key) for existing in self.documents):
+                from pymongo.errors import DuplicateKeyError
+                raise DuplicateKeyError("duplicate key")
+    
+    def _project(self, document, projection):
+        document = dict(document)
+        for field, rule in (projection or {}).items():
+            if isinstance(rule, dict) and '$elemMatch' in rule:
+                document[field] = [item for item in document.get(field, []) if _matches(item, rule['$elemMatch'])][:1]
+        return document
+    
+    def insert_one(self, document):
+        from bson import ObjectId
+        document.setdefault('_id', ObjectId())
+        self._check_unique(document)
+        self.documents.append(document)
+        return type('InsertOneResult', (), {'inserted_id': document['_id']})()
+    
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            self.insert_one(document)
+    
+    def find(self, query=None, projection=None):
+        return FakeCursor([self._project(document, projection) for document in self.documents if _matches(document, query or {})])
+    
+    def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        return next(iter(cursor), None)
+    
+    def count_documents(self, query):
+        return len(self.find(query)._documents)
+    
+    def _apply(self, document, update, inserting):
+        for field, value in update.get('$set', {}).items():
+            _set_path(document, field, value)
+        if inserting:
+            for field, value in update.get('$setOnInsert', {}).items():
+                _set_path(document, field, value)
+        for field, value in update.get('$inc', {}).items():
+            _set_path(document, field, (_get_path(document, field) or 0) + value)
+        for field, value in update.get('$push', {}).items():
+            items = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+            _set_path(document, field, (_get_path(document, field) or []) + list(items))
+        for field, value in update.get('$min', {}).items():
+            current = _get_path(document, field)
+            _set_path(document, field, value if current is None else min(current, value))
+        for field, value in update.get('$max', {}).items():
+            current = _get_path(document, field)
+            _set_path(document, field, value if current is None else max(current, value))
+        for field in update.get('$unset', {}):
+            document.pop(field, None)
+    
+    def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False, return_document=False):
+        document = self.find_one(query, sort=sort)
+        if document is not None:
+            document = next(existing for existing in self.documents if existing['_id'] == document['_id'])
+            before = dict(document)
+            self._apply(document, update, inserting=False)
+            return dict(document) if return_document else before
+        if upsert:
+            created = {key: value for key, value in query.items() if not key.startswith('$') and not isinstance(value, dict)}
+            self._apply(created, update, inserting=True)
+            self.insert_one(created)
+            return dict(created) if return_document else None
+        return None
+    
+    def update_one(self, query, update, upsert=False):
+        document = next((existing for existing in self.documents if _matches(existing, query)), None)
+        if document is not None:
+            self._apply(document, update, inserting=False)
+        elif upsert:
+            self.find_one_and_update(query, update, upsert=True)
+        matched = int(document is not None)
+        return type('UpdateResult', (), {'matched_count': matched, 'modified_count': matched})()
+    
+    def bulk_write(self, operations, ordered=True):
+        modified = 0
+        for operation in operations:
+            for document in self.documents:
+                if _matches(document, operation._filter):
+                    before = deepcopy(document)
+                    self._apply(document, operation._doc, inserting=False)
+                    modified += document != before
+        return type('BulkWriteResult', (), {'modified_count': modified})()
+    
+    def delete_one(self, query):
+        document = next((existing for existing in self.documents if _matches(existing, query)), None)
+        if document is not None:
+            self.documents.remove(document)
+        return type('DeleteResult', (), {'deleted_count': int(document is not None)})()
+
+class FakeDatabase(dict):
+    """Collections by attribute or key, created empty on first use"""
+    
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+    
+    def __getattr__(self, name):
+        return self[name]
+
+@contextmanager
+def request_db(db):
+    """Run model code that reads g.db against the given database"""
+    from flask import Flask, g
+    with Flask(__name__).app_context():
+        g.db = db
+        yield db
+
 def test_mood_ai_service():
     """Test the mood AI service functionality"""
     print("🧪 Testing Mood AI Service...")
@@ -175,6 +410,475 @@ def test_api_structure():
         print(f"❌ API structure test failed: {e}")
         return False
 
+def test_event_buffer_flush():
+    """Test batched event writes, the pending cap and requeue on failure"""
+    print("\n🧪 Testing Event Buffer...")
+    
+    try:
+        from backend.services import event_buffer_service
+        from backend.services.event_buffer_service import EventBuffer
+        
+        collection = RecordingCollection()
+        with background_db(event_buffer_service, events=collection):
+            buffer = EventBuffer('events', batch_size=2, flush_interval=60, max_pending=4)
+            buffer._worker.ensure_started = lambda: None  # flush from this thread only
+            
+            for i in range(5):
+                buffer.add({'n': i})
+            assert buffer.dropped == 1, f"expected 1 dropped event, got {buffer.dropped}"
+            with patch.object(event_buffer_service.logging, 'warning') as warning:
+                assert buffer.flush() == 4
+                buffer.add({'n': 9})
+                buffer.flush()
+            assert warning.call_count == 1 and 'Dropped 1 events' in warning.call_args[0][0]
+            assert [[event['n'] for event in batch] for batch in collection.batches] == [[1, 2], [3, 4], [9]]
+            print("✅ Oldest event dropped at the cap and logged once, the rest written in batches of 2")
+            
+            collection.fail = True
+            buffer.add({'n': 5})
+            assert buffer.flush() == 0
+            collection.fail = False
+            assert buffer.flush() == 1 and collection.batches[-1] == [{'n': 5}]
+            print("✅ Failed batch kept and written on the next flush")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Event buffer test failed: {e!r}")
+        return False
+
+def test_ai_recommendation_normalization():
+    """Test validation of AI responses and cleanup of their alternatives"""
+    print("\n🧪 Testing AI Recommendation Normalization...")
+    
+    try:
+        from backend.services.mood_ai_service import MoodAIService, AI_ALTERNATIVES_COUNT
+        
+        normalized = MoodAIService._normalize_ai_recommendation({
+            'recommendation': {'title': 'Evening Walk'},
+            'alternatives': [
+                {'title': 'evening walk '},
+                {'title': 'Journaling', 'description': 'Write it out'},
+                {'description': 'missing title'},
+                'not a dict',
+                {'title': 'JOURNALING'}
+            ] + [{'title': f'Option {i}'} for i in range(AI_ALTERNATIVES_COUNT + 2)]
+        }, 'activity')
+        
+        recommendation = normalized['recommendation']
+        assert recommendation['type'] == 'activity' and recommendation['description'] == ''
+        titles = [alternative['title'] for alternative in normalized['alternatives']]
+        assert titles[0] == 'Journaling', titles
+        assert len(titles) == AI_ALTERNATIVES_COUNT
+        assert len({title.strip().lower() for title in titles}) == len(titles)
+        assert all(alternative['type'] == 'activity' for alternative in normalized['alternatives'])
+        print(f"✅ Duplicates and malformed alternatives dropped, {len(titles)} kept")
+        
+        for bad_response in ({}, {'recommendation': {'title': ''}}, ['not', 'a', 'dict']):
+            try:
+                MoodAIService._normalize_ai_recommendation(bad_response)
+                raise AssertionError(f"accepted {bad_response!r}")
+            except ValueError:
+                pass
+        print("✅ Responses without a recommendation title rejected")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ AI recommendation normalization test failed: {e!r}")
+        return False
+
+def test_pagination_cursors():
+    """Test keyset cursor encoding and filters"""
+    print("\n🧪 Testing Pagination Cursors...")
+    
+    try:
+        from bson import ObjectId
+        from backend.models.pagination import InvalidCursorError, decode_cursor, encode_cursor, keyset_filter
+        
+        doc_id = ObjectId()
+        created_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+        for sort_value in (created_at, 42.5, [3.0, 1.5], None):
+            cursor = encode_cursor(sort_value, doc_id)
+            assert '=' not in cursor
+            assert decode_cursor(cursor) == (sort_value, doc_id), sort_value
+        print("✅ Datetime, number, list and null sort values round-trip")
+        
+        for bad_cursor in ('not-a-cursor', '', encode_cursor(1, doc_id)[:-3]):
+            try:
+                decode_cursor(bad_cursor)
+                raise AssertionError(f"accepted {bad_cursor!r}")
+            except InvalidCursorError:
+                pass
+        print("✅ Malformed cursors rejected with InvalidCursorError")
+        
+        assert keyset_filter('created_at', created_at, doc_id) == {'$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': doc_id}}
+        ]}
+        assert keyset_filter('created_at', created_at, doc_id, direction=1)['$or'][1]['_id'] == {'$gt': doc_id}
+        print("✅ Keyset filters continue after the last (value, _id)")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Pagination cursor test failed: {e!r}")
+        return False
+
+def test_feed_cache():
+    """Test feed cache hits, TTL expiry and invalidation"""
+    print("\n🧪 Testing Feed Cache...")
+    
+    try:
+        from bson import ObjectId
+        from backend.services import feed_cache_service
+        from backend.services.feed_cache_service import FeedCacheService
+        
+        loads = []
+        
+        def fake_get_posts(limit, mood_filter=None, activity_type_filter=None):
+            loads.append((mood_filter, activity_type_filter))
+            return [
+                {'_id': ObjectId(), 'user_id': ObjectId(), 'created_at': datetime(2024, 5, 1, 12, i), 'mood': mood_filter}
+                for i in range(3)
+            ]
+        
+        community_post = feed_cache_service.CommunityPost
+        original_get_posts = community_post.__dict__['get_posts']
+        community_post.get_posts = staticmethod(fake_get_posts)
+        FeedCacheService._entries.clear()
+        try:
+            posts, keys = FeedCacheService.get_first_page(2, 'Happy')
+            assert len(posts) == 2 and len(keys) == 2 and isinstance(posts[0]['_id'], str)
+            posts[0]['isLiked'] = True
+            posts, _ = FeedCacheService.get_first_page(2, 'happy')
+            assert len(loads) == 1 and 'isLiked' not in posts[0]
+            print("✅ Second read served from cache, per-user flags not cached")
+            
+            FeedCacheService._entries[('happy', None)]['expires_at'] = 0
+            FeedCacheService.get_first_page(2, 'happy')
+            assert len(loads) == 2
+            print("✅ Expired entry reloaded")
+            
+            FeedCacheService.get_first_page(2)
+            FeedCacheService.get_first_page(2, 'sad')
+            FeedCacheService.invalidate('Happy', 'walk')
+            assert set(FeedCacheService._entries) == {('sad', None)}
+            print("✅ New post drops only the pages it belongs to")
+        finally:
+            community_post.get_posts = original_get_posts
+            FeedCacheService._entries.clear()
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Feed cache test failed: {e!r}")
+        return False
+
+def test_counter_buffer_flush():
+    """Test summed counter increments and merge-back on failure"""
+    print("\n🧪 Testing Counter Buffer...")
+    
+    try:
+        from bson import ObjectId
+        from backend.services import counter_service
+        from backend.services.counter_service import CounterBuffer
+        
+        collection = RecordingCollection()
+        with background_db(counter_service, posts=collection):
+            buffer = CounterBuffer('posts', flush_interval=60)
+            buffer._worker.ensure_started = lambda: None  # flush from this thread only
+            hot_post, other_post, quiet_post = ObjectId(), ObjectId(), ObjectId()
+            
+            for _ in range(3):
+                buffer.add(str(hot_post), likes=1)
+            buffer.add(str(other_post), stars=1, likes=1)
+            buffer.add(str(quiet_post), likes=1)
+            buffer.add(str(quiet_post), likes=-1)
+            assert buffer.flush() == 2
+            assert collection.writes == [{hot_post: {'likes': 3}, other_post: {'stars': 1, 'likes': 1}}]
+            print("✅ Increments summed per post, net-zero posts skipped")
+            
+            collection.fail = True
+            buffer.add(str(hot_post), likes=1)
+            assert buffer.flush() == 0
+            collection.fail = False
+            buffer.add(str(hot_post), likes=1)
+            assert buffer.flush() == 1 and collection.writes[-1] == {hot_post: {'likes': 2}}
+            print("✅ Failed increments merged into the next flush")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Counter buffer test failed: {e!r}")
+        return False
+
+def test_reply_tree():
+    """Test nesting comment pages into reply trees"""
+    print("\n🧪 Testing Comment Reply Tree...")
+    
+    try:
+        from bson import ObjectId
+        from backend.models.community_posts import PostComment
+        
+        def comment(minute, parent=None):
+            return {'_id': ObjectId(), 'created_at': datetime(2024, 5, 1, 12, minute), 'parent_comment_id': parent}
+        
+        root = comment(0)
+        late_reply = comment(5, root['_id'])
+        early_reply = comment(1, root['_id'])
+        nested = comment(2, early_reply['_id'])
+        orphan = comment(3, ObjectId())  # parent is on another page
+        
+        roots = PostComment.build_reply_tree([root, late_reply, orphan, early_reply, nested])
+        assert roots == [root, orphan]
+        assert root['replies'] == [early_reply, late_reply]
+        assert early_reply['replies'] == [nested] and orphan['replies'] == []
+        print("✅ Replies nested oldest first, orphans kept at the top level")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Reply tree test failed: {e!r}")
+        return False
+
+def test_chat_bucket_pages():
+    """Test history pages that cross bucket boundaries and message lookup by id"""
+    print("\n🧪 Testing Chat Bucket Pages...")
+    
+    try:
+        from datetime import timedelta
+        from bson import ObjectId
+        from backend.models.chat_buckets import ChatBucket
+        
+        conversation_id = ObjectId()
+        start = datetime(2024, 5, 1, 12, 0)
+        messages = [{'_id': ObjectId(), 'text': f'm{i}', 'created_at': start + timedelta(minutes=i)} for i in range(7)]
+        db = FakeDatabase()
+        for first in range(0, 7, 3):
+            bucket = messages[first:first + 3]
+            db.chat_message_archive.insert_one({
+                'conversation_id': conversation_id,
+                'count': len(bucket),
+                'start_at': bucket[0]['created_at'],
+                'end_at': bucket[-1]['created_at'],
+                'messages': bucket
+            })
+        
+        with request_db(db):
+            pages, before_key = [], None
+            while True:
+                page, before_cursor = ChatBucket.get_archived_history(str(conversation_id), before_key, 2)
+                pages.append([message['text'] for message in page])
+                if not before_cursor:
+                    break
+                before_key = (page[0]['created_at'], page[0]['_id'])
+            assert pages == [['m5', 'm6'], ['m3', 'm4'], ['m1', 'm2'], ['m0']], pages
+            print("✅ Pages of 2 walk back across buckets of 3 without gaps or repeats")
+            
+            page, _ = ChatBucket.get_archived_history(str(conversation_id), None, 5)
+            assert [message['text'] for message in page] == ['m2', 'm3', 'm4', 'm5', 'm6']
+            print("✅ A page larger than a bucket is returned oldest first")
+            
+            found = ChatBucket.get_archived_by_id(str(conversation_id), str(messages[4]['_id']))
+            assert found['text'] == 'm4' and found['conversation_id'] == conversation_id
+            assert ChatBucket.get_archived_by_id(str(conversation_id), str(ObjectId())) is None
+            assert ChatBucket.get_archived_by_id(str(ObjectId()), str(messages[4]['_id'])) is None
+            print("✅ Messages found by id only within their own conversation")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat bucket test failed: {e!r}")
+        return False
+
+def test_chat_send_dedupe():
+    """Test that a retried send with the same client_id is stored once"""
+    print("\n🧪 Testing Chat Send Dedupe...")
+    
+    try:
+        from bson import ObjectId
+        from backend.models.chat import ChatMessage, config as chat_config
+        
+        sender, recipient = str(ObjectId()), str(ObjectId())
+        for buckets_enabled in (False, True):
+            db = FakeDatabase()
+            db['chat_messages'] = FakeCollection(unique=('conversation_id', 'sender_id', 'client_id'))
+            conversation_id = str(db.chat_conversations.insert_one({
+                'participants': sorted([sender, recipient]),
+                'participant_usernames': {sender: 'ann', recipient: 'ben'},
+                'unread_counts': {sender: 0, recipient: 0}
+            }).inserted_id)
+            
+            with request_db(db), patch.object(chat_config, 'CHAT_BUCKETS_ENABLED', buckets_enabled), \
+                    patch.object(ChatMessage, '_publish'):
+                first = ChatMessage.create(conversation_id, sender, 'hello', client_id='c1')
+                retry = ChatMessage.create(conversation_id, sender, 'hello', client_id='c1')
+                other = ChatMessage.create(conversation_id, sender, 'again')
+                ChatMessage.create(conversation_id, sender, 'again')
+            
+            layout = 'buckets' if buckets_enabled else 'documents'
+            stored = [message for bucket in db.chat_message_buckets.documents for message in bucket['messages']] \
+                if buckets_enabled else db.chat_messages.documents
+            assert first == retry and other != first, layout
+            assert len(stored) == 3, f"{layout}: {len(stored)} messages stored"
+            convo = db.chat_conversations.documents[0]
+            assert convo['unread_counts'] == {sender: 0, recipient: 3}, convo['unread_counts']
+            print(f"✅ Retry returns the original id and is not counted again ({layout})")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat send dedupe test failed: {e!r}")
+        return False
+
+def test_chat_mark_read():
+    """Test read cursors and the unread counts they store"""
+    print("\n🧪 Testing Chat Read Cursors...")
+    
+    try:
+        from unittest.mock import Mock
+        from bson import ObjectId
+        from backend.models import chat as chat_model
+        from backend.models.chat import ChatConversation, ChatMessage, config as chat_config
+        
+        ann, ben = str(ObjectId()), str(ObjectId())
+        db = FakeDatabase()
+        conversation_id = str(db.chat_conversations.insert_one({
+            'participants': sorted([ann, ben]),
+            'participant_usernames': {ann: 'ann', ben: 'ben'},
+            'read_state': {},
+            'unread_counts': {ann: 0, ben: 0}
+        }).inserted_id)
+        convo = db.chat_conversations.documents[0]
+        
+        # Every message lands in the same millisecond, so only _id orders them
+        same_millisecond = Mock(utcnow=lambda: datetime(2024, 5, 1, 12, 0))
+        with request_db(db), patch.object(chat_config, 'CHAT_BUCKETS_ENABLED', False), \
+                patch.object(ChatMessage, '_publish'), patch.object(chat_model, 'datetime', same_millisecond):
+            ids = [ChatMessage.create(conversation_id, ann, f'a{i}') for i in range(4)]
+            assert convo['unread_counts'] == {ann: 0, ben: 4}
+            
+            second = ChatMessage.get_by_id(conversation_id, ids[1])
+            assert ChatConversation.mark_read(conversation_id, ben, second) == 2
+            assert convo['unread_counts'][ben] == 2 and convo['read_state'][ben]['last_read_id'] == second['_id']
+            print("✅ Reading up to a message leaves the later ones from others unread")
+            
+            first = ChatMessage.get_by_id(conversation_id, ids[0])
+            assert ChatConversation.mark_read(conversation_id, ben, first) is None
+            assert convo['read_state'][ben]['last_read_id'] == second['_id']
+            print("✅ The read cursor never moves backwards")
+            
+            last = ChatMessage.get_by_id(conversation_id, ids[3])
+            count_after = ChatMessage.count_after
+            late = []
+            
+            def count_then_send(*args, **kwargs):
+                # Another message lands between the count and the store
+                count = count_after(*args, **kwargs)
+                if not late:
+                    late.append(ChatMessage.create(conversation_id, ann, 'late'))
+                return count
+            
+            with patch.object(ChatMessage, 'count_after', side_effect=count_then_send):
+                assert ChatConversation.mark_read(conversation_id, ben, last) == 1
+            assert convo['unread_counts'][ben] == 1
+            print("✅ A message sent during mark_read triggers a recount")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat read cursor test failed: {e!r}")
+        return False
+
+def test_chat_inbox_paging():
+    """Test inbox pages by latest message, with empty conversations last"""
+    print("\n🧪 Testing Chat Inbox Paging...")
+    
+    try:
+        from bson import ObjectId
+        from backend.models.chat import ChatConversation
+        
+        user_id = str(ObjectId())
+        db = FakeDatabase()
+        times = [datetime(2024, 5, 1, 12, minute) for minute in (5, 9, 9, 1)] + [None, None]
+        for index, last_message_at in enumerate(times):
+            db.chat_conversations.insert_one({
+                'participants': [user_id, str(ObjectId())],
+                'last_message_at': last_message_at,
+                'name': f'c{index}'
+            })
+        db.chat_conversations.insert_one({'participants': [str(ObjectId())], 'last_message_at': times[0], 'name': 'other'})
+        
+        with request_db(db):
+            pages, cursor = [], None
+            while True:
+                conversations, cursor = ChatConversation.list_for_user(user_id, limit=2, cursor=cursor)
+                pages.append([conversation['name'] for conversation in conversations])
+                if not cursor:
+                    break
+        
+        assert pages == [['c2', 'c1'], ['c0', 'c3'], ['c5', 'c4'], []], pages
+        print("✅ Newest first with ties broken by _id, empty conversations after, no repeats")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat inbox paging test failed: {e!r}")
+        return False
+
+def test_username_change_claims():
+    """Test claiming, renewing and losing a username propagation claim"""
+    print("\n🧪 Testing Username Propagation Claims...")
+    
+    try:
+        from datetime import timedelta
+        from bson import ObjectId
+        from backend.models.username_changes import UsernameChange
+        from backend.services import username_propagation_service
+        from backend.services.username_propagation_service import UsernamePropagationService
+        
+        user_id = ObjectId()
+        db = FakeDatabase()
+        for _ in range(5):
+            db.community_posts.insert_one({'user_id': user_id, 'user_username': 'old'})
+        
+        UsernameChange.request(db, str(user_id), 'new')
+        change = UsernameChange.claim(db)
+        assert change['status'] == 'running' and UsernameChange.claim(db) is None
+        assert UsernameChange.renew(db, change)
+        print("✅ A running change is not claimed twice while its claim is renewed")
+        
+        takeovers = []
+        original_bulk_write = db.community_posts.bulk_write
+        
+        def bulk_write_then_take_over(operations, ordered=True):
+            # The claim goes stale after the first batch and another pass takes the change
+            result = original_bulk_write(operations, ordered)
+            if not takeovers:
+                takeovers.append(UsernameChange.claim(db, stale_after=timedelta(seconds=-1)))
+            return result
+        
+        with patch.object(username_propagation_service.config, 'USERNAME_PROPAGATION_BATCH_SIZE', 2), \
+                patch.object(username_propagation_service.config, 'USERNAME_PROPAGATION_PAUSE_SECONDS', 0), \
+                patch.object(db.community_posts, 'bulk_write', side_effect=bulk_write_then_take_over):
+            assert UsernamePropagationService._apply(db, change) == 2
+            assert not UsernameChange.renew(db, change)
+            assert db.username_changes.find_one({'_id': user_id})['claimed_at'] == takeovers[0]['claimed_at']
+            print("✅ A pass that lost its claim stops at the next batch and leaves the change to the new owner")
+            
+            assert UsernamePropagationService._apply(db, takeovers[0]) == 3
+        
+        assert [post['user_username'] for post in db.community_posts.documents] == ['new'] * 5
+        assert db.username_changes.find_one({'_id': user_id}) is None
+        print("✅ The new owner finishes the change and removes it from the queue")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Username propagation claim test failed: {e!r}")
+        return False
+
 def main():
     """Run all core tests"""
     print("🚀 Testing Mood Journal Core Functionality")
@@ -186,7 +890,18 @@ def main():
         test_mood_categorization,
         test_recommendation_personalization,
         test_mood_recommendation_variety,
-        test_api_structure
+        test_api_structure,
+        test_event_buffer_flush,
+        test_ai_recommendation_normalization,
+        test_pagination_cursors,
+        test_feed_cache,
+        test_counter_buffer_flush,
+        test_reply_tree,
+        test_chat_bucket_pages,
+        test_chat_send_dedupe,
+        test_chat_mark_read,
+        test_chat_inbox_paging,
+        test_username_change_claims
     ]
     
     passed = 0